@@ -0,0 +1,300 @@
+"""
+Cache of full alignment results (score matrix and steps)
+Results are keyed by a hash of the sequences, mode and scoring parameters and
+kept in an in-memory LRU under a byte budget; an optional directory keeps them
+as compressed .npz files across restarts
+The batch commands cache only their small per-pair results (ResultCache)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from improved_algorithm import AffineAlignmentSteps, AlignmentSteps, IncrementalAligner
+from substitution_matrices import sequence_codes
+
+# Default in-memory budget of a cache
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Default number of per-pair results kept in memory by a ResultCache
+DEFAULT_MAX_ENTRIES = 65536
+
+# Directory of the disk store of the shared cache, when set
+CACHE_DIR_VARIABLE = "ALIGNMENT_CACHE_DIR"
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def cache_key(mode, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend=None, substitution=None):
+    """
+    Returns the hex digest identifying one alignment problem
+    A gap_extend equal to the gap penalty is the linear model and hashes the same as None
+    """
+    if gap_extend is None:
+        gap_extend = gap_penalty
+    if substitution is not None and not isinstance(substitution, str):
+        substitution = substitution.name
+
+    digest = hashlib.sha256()
+    digest.update(repr((mode, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution)).encode())
+    for seq in (seq1, seq2):
+        data = np.ascontiguousarray(sequence_codes(seq), dtype=np.uint8)
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _result_arrays(result):
+    """Returns the arrays of an entry point result, keyed for an .npz file"""
+    score, steps = result[:2]
+    arrays = {
+        "score": score,
+        "directions": steps.directions,
+        "codes1": steps.codes1,
+        "codes2": steps.codes2,
+        "lookup": steps.lookup,
+    }
+    if isinstance(steps, AffineAlignmentSteps):
+        arrays["vertical"] = steps.vertical
+        arrays["horizontal"] = steps.horizontal
+    else:
+        arrays["gap_penalty"] = np.array(steps.gap_penalty)
+    if len(result) == 3:
+        arrays["max_pos"] = np.array(result[2])
+    return arrays
+
+
+def _result_from_arrays(arrays):
+    """Rebuilds an entry point result from its arrays"""
+    for array in arrays.values():
+        array.setflags(write=False)
+
+    if "vertical" in arrays:
+        steps = AffineAlignmentSteps(arrays["score"], arrays["directions"], arrays["vertical"],
+                                     arrays["horizontal"], arrays["codes1"], arrays["codes2"], arrays["lookup"])
+    else:
+        steps = AlignmentSteps(arrays["score"], arrays["directions"], arrays["codes1"], arrays["codes2"],
+                               arrays["lookup"], int(arrays["gap_penalty"]))
+
+    if "max_pos" in arrays:
+        max_i, max_j = arrays["max_pos"].tolist()
+        return arrays["score"], steps, (max_i, max_j)
+    return arrays["score"], steps
+
+
+class AlignmentCache:
+    """
+    LRU cache of alignment results with an optional compressed disk store
+    Cached matrices are shared between callers and therefore read-only
+    Safe to use from several threads; misses are computed outside the lock
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, size), least recently used first
+        # mode -> (scoring, aligner); misses reuse the previous matrices of their
+        # mode, so alternating between the pages keeps both incremental states
+        self._aligners = {}
+        self._lock = threading.RLock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.directory is not None and os.path.exists(self._path(key))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        """Returns the cached result of key, or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+            result = _result_from_arrays(arrays)
+            with self._lock:
+                self._remember(key, result, sum(array.nbytes for array in arrays.values()))
+                self.hits += 1
+            return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Caches the result of key in memory and, with a directory, on disk"""
+        arrays = _result_arrays(result)
+        for array in arrays.values():
+            array.setflags(write=False)
+        with self._lock:
+            self._remember(key, result, sum(array.nbytes for array in arrays.values()))
+
+        if self.directory is not None:
+            # Written under a temporary name first so readers never see half a file
+            handle, temporary = tempfile.mkstemp(suffix=".npz", dir=self.directory)
+            with os.fdopen(handle, "wb") as stream:
+                np.savez_compressed(stream, **arrays)
+            os.replace(temporary, self._path(key))
+
+    def _remember(self, key, result, size):
+        """Adds a result to the in-memory LRU and evicts down to the byte budget"""
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (result, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        """Empties the in-memory LRU; the disk store is kept"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _align(self, mode, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution,
+               progress):
+        """
+        Returns the cached result of an alignment or computes and caches it
+        Misses go through an IncrementalAligner per mode, kept while the scoring
+        stays the same, so editing the end of a sequence only fills the new rows
+        or columns
+        progress is handed to IncrementalAligner.align and called once more
+        before the result is cached, as the disk store is slow to write; an
+        exception it raises propagates and caches nothing
+        """
+        key = cache_key(mode, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution)
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        scoring = (match_award, mismatch_penalty, gap_penalty, gap_extend, substitution)
+        with self._lock:
+            kept_scoring, aligner = self._aligners.get(mode, (None, None))
+            if aligner is None or kept_scoring != scoring:
+                aligner = IncrementalAligner(match_award, mismatch_penalty, gap_penalty, gap_extend,
+                                             local=mode == "sw", substitution=substitution)
+                self._aligners[mode] = (scoring, aligner)
+
+        result = aligner.align(seq1, seq2, progress)
+        if progress is not None:
+            progress(1, 1)
+        self.put(key, result)
+        return result
+
+    def needleman_wunsch(self, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend=None,
+                         substitution=None, progress=None):
+        """
+        Cached compute_needleman_wunsch, or its affine version when gap_extend
+        differs from gap_penalty; returns the score matrix and the steps
+        """
+        return self._align("nw", seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution,
+                           progress)
+
+    def smith_waterman(self, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend=None,
+                       substitution=None, progress=None):
+        """
+        Cached compute_smith_waterman, or its affine version when gap_extend
+        differs from gap_penalty; returns the score matrix, steps and max position
+        """
+        return self._align("sw", seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution,
+                           progress)
+
+
+class ResultCache:
+    """
+    LRU cache of small per-pair results, such as batch alignment records and
+    search scores, with an optional disk store of one JSON file per result
+    kind tells apart results of different commands stored under the same key;
+    values must be JSON-compatible, and tuples come back as lists
+    """
+
+    def __init__(self, kind, directory=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.kind = kind
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> value, least recently used first
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.{self.kind}.json")
+
+    def get(self, key):
+        """Returns the cached value of key, or None"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with open(self._path(key)) as handle:
+                value = json.load(handle)
+            self._remember(key, value)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Caches the value of key in memory and, with a directory, on disk"""
+        value = json.loads(json.dumps(value))
+        self._remember(key, value)
+
+        if self.directory is not None:
+            # Written under a temporary name first, as pool workers share the directory
+            handle, temporary = tempfile.mkstemp(suffix=".json", dir=self.directory)
+            with os.fdopen(handle, "w") as stream:
+                json.dump(value, stream)
+            os.replace(temporary, self._path(key))
+
+    def _remember(self, key, value):
+        """Adds a value to the in-memory LRU and evicts down to max_entries"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def shared_cache():
+    """
+    Returns the process-wide cache used by the GUI pages
+    Setting the ALIGNMENT_CACHE_DIR environment variable enables its disk store
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AlignmentCache(directory=os.environ.get(CACHE_DIR_VARIABLE) or None)
+    return _shared_cache
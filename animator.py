@@ -0,0 +1,113 @@
+"""
+Frame-budgeted animation for the algorithm pages
+Instead of one step per Tk after() callback, every frame runs as many steps as
+fit in a share of the frame time (or as many as a set rate makes due), so long
+animations finish at whatever speed the machine allows and the window stays
+responsive
+"""
+
+import time
+from collections import deque
+
+# Frames per second the animation aims for
+TARGET_FPS = 30
+
+# Share of a frame spent on steps; the rest is left for Tk to redraw and handle events
+FRAME_BUDGET = 0.6
+
+# Seconds of history the reported steps-per-second rate is measured over
+RATE_WINDOW = 1.0
+
+
+class FrameAnimator:
+    """
+    Calls step() repeatedly while has_more() is true, one batch per frame
+    With a rate (steps per second) a batch runs only the steps that are due, so
+    slow speeds stay watchable; without one a batch runs until the frame budget
+    is spent. on_frame(steps_per_second) is called after every frame with the
+    measured rate and on_finish() once nothing is left
+    """
+
+    def __init__(self, widget, step, has_more, on_frame=None, on_finish=None, fps=TARGET_FPS):
+        self.widget = widget
+        self.step = step
+        self.has_more = has_more
+        self.on_frame = on_frame
+        self.on_finish = on_finish
+        self.fps = fps
+
+        self.rate = None
+        self.running = False
+        self.after_id = None
+        self.done = 0  # steps since start()
+        self.due = 0.0  # steps the rate allows but that have not run yet
+        self.last_frame = 0.0
+        self.history = deque()  # (time, done) of the recent frames
+
+    def start(self, rate=None):
+        """Starts (or restarts) the animation; rate is in steps per second, None for unlimited"""
+        self.stop()
+        self.rate = rate
+        self.running = True
+        self.done = 0
+        self.due = 1.0  # the first step runs at once
+        self.last_frame = time.perf_counter()
+        self.history = deque([(self.last_frame, 0)])
+        self._frame()
+
+    def stop(self):
+        """Stops the animation; steps already run stay"""
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+        self.running = False
+
+    def steps_per_second(self):
+        """Returns the rate measured over the last RATE_WINDOW seconds"""
+        (first_time, first_done), (last_time, last_done) = self.history[0], self.history[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_done - first_done) / (last_time - first_time)
+
+    def _frame(self):
+        self.after_id = None
+        if not self.running:
+            return
+
+        frame = 1.0 / self.fps
+        now = time.perf_counter()
+        deadline = now + frame * FRAME_BUDGET
+
+        if self.rate is None:
+            allowed = float("inf")
+        else:
+            # Steps owed since the last frame, without bursting after a stall
+            self.due = min(self.due + (now - self.last_frame) * self.rate, self.rate * frame * 2 + 1)
+            allowed = int(self.due)
+        self.last_frame = now
+
+        count = 0
+        while count < allowed and self.has_more():
+            self.step()
+            count += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.done += count
+        if self.rate is not None:
+            self.due -= count
+
+        finished = time.perf_counter()
+        self.history.append((finished, self.done))
+        while len(self.history) > 2 and finished - self.history[1][0] >= RATE_WINDOW:
+            self.history.popleft()
+        if self.on_frame is not None:
+            self.on_frame(self.steps_per_second())
+
+        if not self.has_more():
+            self.running = False
+            if self.on_finish is not None:
+                self.on_finish()
+            return
+
+        delay = max(1, int((now + frame - finished) * 1000))
+        self.after_id = self.widget.after(delay, self._frame)
@@ -0,0 +1,101 @@
+"""
+Background jobs for the GUI pages
+A job runs its work on a worker thread so the window stays responsive; the
+worker never touches Tk and hands progress and the result to the Tk thread
+through a queue that an after() callback polls
+"""
+
+import queue
+import threading
+
+# Milliseconds between two polls of a job's queue
+POLL_INTERVAL = 50
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work by job.progress() or job.check() once the job was cancelled"""
+
+
+class BackgroundJob:
+    """
+    Runs work(job, *args) on a daemon thread
+    work reports with job.progress(done, total) and calls job.check() between
+    its stages, which is where it stops once cancel() was called; args should be
+    a snapshot of the inputs, as the Tk thread may change its own state while a
+    cancelled job still runs; on the Tk thread on_progress(done, total),
+    on_done(result) or on_error(exception) are called as the messages arrive
+    Nothing is called back after cancel(), even if the work still finishes
+    """
+
+    def __init__(self, widget, work, args=(), on_progress=None, on_done=None, on_error=None):
+        self.widget = widget
+        self.work = work
+        self.args = args
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = None
+        self.poll_id = None
+
+    def start(self):
+        """Starts the worker thread and the polling"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.poll_id = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def cancel(self):
+        """Asks the work to stop at its next progress report or check and drops its messages"""
+        self.cancelled.set()
+        if self.poll_id is not None:
+            self.widget.after_cancel(self.poll_id)
+            self.poll_id = None
+
+    def check(self):
+        """Called by the work between stages: raises JobCancelled once the job was cancelled"""
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self, done, total):
+        """Called by the work: queues a progress report, or raises JobCancelled"""
+        self.check()
+        self.messages.put(("progress", (done, total)))
+
+    def _run(self):
+        """Worker thread: runs the work and queues how it ended"""
+        try:
+            result = self.work(self, *self.args)
+        except JobCancelled:
+            return
+        except Exception as error:
+            self.messages.put(("error", error))
+        else:
+            self.messages.put(("done", result))
+
+    def _poll(self):
+        """Tk thread: handles the queued messages, only the latest progress of a batch"""
+        self.poll_id = None
+        latest = None
+        while not self.cancelled.is_set():
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                latest = value
+                continue
+
+            # The work has ended
+            if kind == "done" and self.on_done is not None:
+                self.on_done(value)
+            elif kind == "error" and self.on_error is not None:
+                self.on_error(value)
+            return
+
+        if self.cancelled.is_set():
+            return
+        if latest is not None and self.on_progress is not None:
+            self.on_progress(*latest)
+        self.poll_id = self.widget.after(POLL_INTERVAL, self._poll)
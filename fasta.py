@@ -0,0 +1,346 @@
+"""
+FASTA input for sequence alignment
+"""
+
+import gzip
+import mmap
+import os
+from collections import namedtuple
+
+import numpy as np
+
+
+# Bytes read per step by the streaming parser; a record longer than this is
+# collected in pieces and joined once complete
+READ_CHUNK = 1 << 20
+
+
+def _open_binary(path):
+    """Opens a plain or gzip-compressed file for binary reading"""
+    with open(path, "rb") as handle:
+        magic = handle.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+
+def _parse_fasta_block(block):
+    """Parses a block of complete FASTA records, block starting at a '>'"""
+    for record in block[1:].split(b"\n>"):
+        header, _, body = record.partition(b"\n")
+        words = header.split(maxsplit=1)
+        yield words[0].decode() if words else "", b"".join(body.split()).decode("ascii", "replace"), None
+
+
+def _fasta_records(chunks):
+    """
+    Yields (name, sequence, None) from FASTA data arriving in chunks
+    Complete records are parsed a block at a time with bytes operations; only
+    the unfinished last record is carried over to the next chunk
+    """
+    pending = []
+    started = False
+    for chunk in chunks:
+        if not started:
+            # Skip anything before the first header
+            chunk = (pending[0] if pending else b"\n") + chunk
+            first = chunk.find(b"\n>")
+            if first < 0:
+                pending = [chunk[-1:]]
+                continue
+            chunk = chunk[first + 1:]
+            pending = []
+            started = True
+
+        cut = chunk.rfind(b"\n>")
+        if cut < 0:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:cut])
+        yield from _parse_fasta_block(b"".join(pending))
+        pending = [chunk[cut + 1:]]
+
+    if started and pending:
+        yield from _parse_fasta_block(b"".join(pending))
+
+
+def _parse_fastq_lines(lines):
+    """Parses complete four-line FASTQ records"""
+    for k in range(0, len(lines), 4):
+        header, sequence, separator, quality = (line.rstrip(b"\r") for line in lines[k:k + 4])
+        if not header.startswith(b"@") or not separator.startswith(b"+") or len(sequence) != len(quality):
+            raise ValueError(f"Malformed FASTQ record {header[:50]!r}")
+        words = header[1:].split(maxsplit=1)
+        yield words[0].decode() if words else "", sequence.decode("ascii", "replace"), quality.decode("ascii")
+
+
+def _fastq_records(chunks):
+    """
+    Yields (name, sequence, quality) from FASTQ data arriving in chunks
+    Records are the usual four lines (no wrapped sequence or quality lines)
+    """
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        complete = (len(lines) - 1) // 4 * 4
+        yield from _parse_fastq_lines(lines[:complete])
+        pending = b"\n".join(lines[complete:])
+
+    lines = pending.rstrip().split(b"\n") if pending.strip() else []
+    if len(lines) % 4:
+        raise ValueError("Truncated FASTQ record at the end of the input")
+    yield from _parse_fastq_lines(lines)
+
+
+def read_records(path, qualities=False, chunk_size=READ_CHUNK):
+    """
+    Streams the records of a FASTA or FASTQ file, plain or gzip-compressed
+    A file starting with '@' is FASTQ, anything else FASTA; the file is
+    read chunk_size bytes at a time, so memory is bounded by the chunk size and
+    the longest record
+    Yields (name, sequence) pairs, or (name, sequence, quality) with qualities
+    set; FASTA records have no quality (None)
+    """
+    with _open_binary(path) as handle:
+        first = handle.read(chunk_size)
+
+        def chunks():
+            yield first
+            while True:
+                chunk = handle.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+        # The FASTA parser skips any text before the first header
+        if first.lstrip()[:1] == b"@":
+            records = _fastq_records(chunks())
+        else:
+            records = _fasta_records(chunks())
+
+        for name, sequence, quality in records:
+            yield (name, sequence, quality) if qualities else (name, sequence)
+
+
+def read_fasta(path):
+    """
+    Reads a FASTA file one record at a time
+    Yields (name, sequence) pairs; the name is the first word of the header
+    Same as read_records(path), which also reads FASTQ and gzip input
+    """
+    return read_records(path)
+
+
+# One .fai line: sequence name, length, file offset of the first base, bases per
+# line and bytes per line (with the newline), as written by samtools faidx
+FaiEntry = namedtuple("FaiEntry", ["name", "length", "offset", "line_bases", "line_width"])
+
+
+def build_fai(path):
+    """
+    Scans a FASTA file once and returns its FaiEntry list
+    Every sequence line but the last of a record must have the same length
+    """
+    entries = []
+    name = None
+
+    def finish():
+        if name is not None:
+            entries.append(FaiEntry(name, length, sequence_offset, line_bases or 0, line_width or 0))
+
+    offset = 0
+    with open(path, "rb") as handle:
+        for line in handle:
+            size = len(line)
+            if line.startswith(b">"):
+                finish()
+                name = line[1:].split(maxsplit=1)[0].decode() if len(line.strip()) > 1 else ""
+                sequence_offset = offset + size
+                length = 0
+                line_bases = line_width = None
+                ragged = False
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases is None:
+                    line_bases, line_width = bases, size
+                elif ragged and bases:
+                    raise ValueError(f"Different line length in sequence '{name}' at byte {offset}")
+                elif bases > line_bases:
+                    raise ValueError(f"Different line length in sequence '{name}' at byte {offset}")
+                # Only the last line of a record may be shorter or lack its newline
+                ragged = ragged or bases < line_bases or size != line_width
+                length += bases
+            offset += size
+    finish()
+
+    return entries
+
+
+def write_fai(entries, fai_path):
+    """Writes FaiEntry records in the samtools .fai layout"""
+    with open(fai_path, "w") as handle:
+        for entry in entries:
+            handle.write("\t".join(str(field) for field in entry) + "\n")
+
+
+def read_fai(fai_path):
+    """Reads a .fai file into a list of FaiEntry records"""
+    entries = []
+    with open(fai_path) as handle:
+        for line in handle:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 5:
+                entries.append(FaiEntry(fields[0], *(int(field) for field in fields[1:5])))
+    return entries
+
+
+class FastaRegion:
+    """
+    Lazy [start, end) slice of one indexed FASTA sequence
+    Nothing is read until the codes are needed: a region inside one line is a
+    view of the memory-mapped file, and only one spanning lines is copied,
+    with the newlines dropped, when it is converted to an array
+    """
+
+    def __init__(self, buffer, entry, start, end):
+        self.buffer = buffer
+        self.entry = entry
+        self.start = start
+        self.end = end
+
+    @property
+    def name(self):
+        return self.entry.name
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"FastaRegion({self.entry.name}:{self.start + 1}-{self.end})"
+
+    def __str__(self):
+        return self.tobytes().decode("ascii", "replace")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return np.asarray(self)[index]
+            return FastaRegion(self.buffer, self.entry, self.start + start, self.start + max(start, stop))
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("region index out of range")
+        return self.buffer[self._file_offset(self.start + index)]
+
+    def _file_offset(self, position):
+        """File offset of a 0-based position of the sequence"""
+        line, column = divmod(position, self.entry.line_bases)
+        return self.entry.offset + line * self.entry.line_width + column
+
+    def __array__(self, dtype=None, copy=None):
+        codes = self._codes()
+        return codes if dtype is None else codes.astype(dtype, copy=False)
+
+    def _codes(self):
+        if self.end <= self.start:
+            return np.zeros(0, dtype=np.uint8)
+
+        line_bases = self.entry.line_bases
+        first_line = self.start // line_bases
+        last_line = (self.end - 1) // line_bases
+        if first_line == last_line:
+            return np.frombuffer(self.buffer, dtype=np.uint8, count=len(self), offset=self._file_offset(self.start))
+
+        # Full lines in between are a strided view that skips the newlines
+        head_end = (first_line + 1) * line_bases
+        tail_start = last_line * line_bases
+        middle = np.ndarray((last_line - first_line - 1, line_bases), dtype=np.uint8, buffer=self.buffer,
+                            offset=self.entry.offset + (first_line + 1) * self.entry.line_width,
+                            strides=(self.entry.line_width, 1))
+        return np.concatenate((
+            np.frombuffer(self.buffer, dtype=np.uint8, count=head_end - self.start,
+                          offset=self._file_offset(self.start)),
+            middle.reshape(-1),
+            np.frombuffer(self.buffer, dtype=np.uint8, count=self.end - tail_start,
+                          offset=self._file_offset(tail_start)),
+        ))
+
+    def tobytes(self):
+        """Returns the bases of the region as bytes"""
+        return self._codes().tobytes()
+
+
+class FastaIndex:
+    """
+    Random access to the records of a FASTA file through a samtools-style .fai
+    The index is built next to the file on first use (or when the file is newer)
+    and the file itself is memory-mapped, so regions cost no reads up front
+    """
+
+    def __init__(self, path, fai_path=None):
+        self.path = path
+        self.fai_path = fai_path or path + ".fai"
+
+        if not os.path.exists(self.fai_path) or os.path.getmtime(self.fai_path) < os.path.getmtime(path):
+            write_fai(build_fai(path), self.fai_path)
+        self.entries = {entry.name: entry for entry in read_fai(self.fai_path)}
+
+        self._handle = open(path, "rb")
+        if os.path.getsize(path):
+            self.buffer = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.buffer = b""
+
+    @property
+    def names(self):
+        return list(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.fetch(name)
+
+    def fetch(self, name, start=0, end=None):
+        """Returns the 0-based, half-open [start, end) region of a sequence"""
+        if name not in self.entries:
+            raise KeyError(f"Sequence '{name}' is not in {self.path}")
+        entry = self.entries[name]
+        end = entry.length if end is None else min(end, entry.length)
+        start = max(0, min(start, end))
+        return FastaRegion(self.buffer, entry, start, end)
+
+    def region(self, text):
+        """
+        Returns a region written as samtools does: "name", "name:start" or
+        "name:start-end", with 1-based inclusive coordinates
+        """
+        if text in self.entries:
+            return self.fetch(text)
+
+        name, _, span = text.rpartition(":")
+        if not name:
+            raise KeyError(f"Sequence '{text}' is not in {self.path}")
+        first, _, last = span.replace(",", "").partition("-")
+        start = int(first) - 1 if first else 0
+        end = int(last) if last else None
+        return self.fetch(name, start, end)
+
+    def close(self):
+        """Releases the memory map and the file"""
+        if isinstance(self.buffer, mmap.mmap):
+            try:
+                self.buffer.close()
+            except BufferError:
+                # Region arrays still view the map; it goes away with the last of them
+                pass
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
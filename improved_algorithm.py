@@ -1,14 +1,240 @@
 """
 Optimized algorithm implementation for sequence alignment visualization
 This module contains optimized versions of the alignment algorithms
+Full matrices are filled one row at a time (_fill_rows, _fill_rows_affine): the
+vertical and diagonal moves of a row are whole-row NumPy operations and its
+horizontal gaps a running maximum, which measured faster than evaluating one
+anti-diagonal per step
 """
 
+from collections import namedtuple
+from collections.abc import Sequence
+
 import numpy as np
 
+from substitution_matrices import get_matrix, sequence_codes
+
+# Bit flags of the traceback direction matrix (co-optimal moves set several bits)
+DIAGONAL = 1
+UP = 2
+LEFT = 4
+ZERO = 8
+LEFT_OPEN = 16
+UP_OPEN = 32
+
+# "Minus infinity" for affine gap states, with headroom so additions cannot wrap
+NEGATIVE_INFINITY = np.iinfo(np.int64).min // 4
+
+# Rows of the direction matrix derived per NumPy pass, to bound temporaries
+DIRECTION_BLOCK_ROWS = 256
+
+# Rows a kernel fills between two progress reports
+PROGRESS_INTERVAL = 64
+
+# Below this many matrix cells Hirschberg hands the block to the full-matrix kernel
+HIRSCHBERG_THRESHOLD = 1 << 20
+
+# Result of a seed extension; start and end are matrix cells, visited is an
+# (cells x 2) array of every (i, j) cell the extension computed
+SeedExtension = namedtuple("SeedExtension", ["score", "start", "end", "align1", "align2", "path", "visited"])
+
+# One of the non-intersecting local alignments found by Waterman-Eggert
+LocalAlignment = namedtuple("LocalAlignment", ["score", "align1", "align2", "path", "start", "end"])
+
+
+def _sequence_text(seq):
+    """
+    Returns the sequence as a string for building alignment strings
+    """
+    if isinstance(seq, str):
+        return seq
+    return bytes(sequence_codes(seq)).decode("ascii", "replace")
+
 
-def compute_needleman_wunsch(seq1, seq2, match_award, mismatch_penalty, gap_penalty):
+def _encode_many(sequences, match_award, mismatch_penalty, substitution=None):
+    """
+    Encodes sequences to uint8 symbol indices over one shared alphabet
+    Returns the list of codes and the (alphabet x alphabet) lookup table of pair scores
+    Without a substitution matrix the alphabet is the set of symbols present and
+    the lookup holds match_award on its diagonal and mismatch_penalty elsewhere
+    """
+    if substitution is not None:
+        if isinstance(substitution, str):
+            substitution = get_matrix(substitution)
+        return [substitution.encode(seq) for seq in sequences], substitution.scores
+
+    raw = [sequence_codes(seq) for seq in sequences]
+    symbols, inverse = np.unique(np.concatenate(raw) if raw else np.zeros(0, np.uint8), return_inverse=True)
+    codes = inverse.astype(np.uint8)
+    bounds = np.cumsum([0] + [len(r) for r in raw])
+
+    dtype = np.result_type(np.min_scalar_type(match_award), np.min_scalar_type(mismatch_penalty))
+    lookup = np.full((max(len(symbols), 1),) * 2, mismatch_penalty, dtype=dtype)
+    np.fill_diagonal(lookup, match_award)
+
+    return [codes[bounds[k]:bounds[k + 1]] for k in range(len(raw))], lookup
+
+
+def _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution=None):
+    """
+    Encodes both sequences to uint8 symbol indices
+    Returns the codes and the (alphabet x alphabet) lookup table of pair scores
+    """
+    (codes1, codes2), lookup = _encode_many((seq1, seq2), match_award, mismatch_penalty, substitution)
+    return codes1, codes2, lookup
+
+
+def _substitution_table(codes1, codes2, lookup):
+    """
+    Builds the (m+1)x(n+1) table of diagonal scores
+    Every row is a gather from the (alphabet x n) query profile of seq1
+    Row 0 and column 0 are padding so the table shares the score matrix layout
+    """
+    profile = lookup[:, codes1]
+
+    table = np.zeros((len(codes2) + 1, len(codes1) + 1), dtype=lookup.dtype)
+    table[1:, 1:] = profile[codes2]
+    return table
+
+
+def _boundary_directions(rows, cols, local, affine=False):
+    """
+    Returns a direction matrix with only its first row and column set
+    Local alignments restart on the boundary, global ones follow the edge
+    """
+    directions = np.zeros((rows, cols), dtype=np.uint8)
+    if local:
+        directions[0, :] = ZERO
+        directions[:, 0] = ZERO
+    else:
+        directions[0, 1:] = LEFT
+        directions[1:, 0] = UP
+        # An affine edge gap is opened once, at the corner
+        if affine and cols > 1:
+            directions[0, 1] |= LEFT_OPEN
+        if affine and rows > 1:
+            directions[1, 0] |= UP_OPEN
+    return directions
+
+
+def _fill_rows(score, table, gap_penalty, local, progress=None):
+    """
+    Fills the score matrix in place one row at a time from its first row and column
+    Horizontal gaps of a row are a running maximum, so each row is a few NumPy
+    passes; linear gaps make the recurrence symmetric, so a matrix taller than it
+    is wide is filled through a transposed copy to keep the rows long
+    progress, when given, is called with the fraction of rows filled
+    """
+    rows, cols = score.shape
+    if rows > cols:
+        transposed = np.ascontiguousarray(score.T)
+        _fill_rows(transposed, np.ascontiguousarray(table.T), gap_penalty, local, progress)
+        score[...] = transposed.T
+        return
+
+    ramp = gap_penalty * np.arange(cols)
+    for i in range(1, rows):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress(i / rows)
+        current = score[i]
+        np.add(score[i - 1, :-1], table[i, 1:], out=current[1:])
+        np.maximum(current[1:], score[i - 1, 1:] + gap_penalty, out=current[1:])
+        if local:
+            np.maximum(current, 0, out=current)
+
+        # Horizontal gaps: H[j] = max over k <= j of (H[k] + gap * (j - k))
+        current -= ramp
+        np.maximum.accumulate(current, out=current)
+        current += ramp
+
+
+def _direction_matrix(score, table, gap_penalty, local):
+    """
+    Derives the bit-packed uint8 traceback directions from a filled score matrix
+    Every move that reproduces a cell's score is flagged, so ties are kept
+    """
+    rows, cols = score.shape
+    directions = _boundary_directions(rows, cols, local)
+
+    for top in range(1, rows, DIRECTION_BLOCK_ROWS):
+        bottom = min(top + DIRECTION_BLOCK_ROWS, rows)
+        cell = score[top:bottom, 1:]
+        block = directions[top:bottom, 1:]
+
+        block |= (cell == score[top - 1:bottom - 1, :-1] + table[top:bottom, 1:]) * np.uint8(DIAGONAL)
+        block |= (cell == score[top - 1:bottom - 1, 1:] + gap_penalty) * np.uint8(UP)
+        block |= (cell == score[top:bottom, :-1] + gap_penalty) * np.uint8(LEFT)
+        if local:
+            block |= (cell == 0) * np.uint8(ZERO)
+
+    return directions
+
+
+class AlignmentSteps(Sequence):
+    """
+    Read-only list of the per-cell step records, in row-major order
+    Records are rebuilt on access from the score and direction matrices
+    """
+
+    def __init__(self, score, directions, codes1, codes2, lookup, gap_penalty):
+        self.score = score
+        self.directions = directions
+        self.codes1 = codes1
+        self.codes2 = codes2
+        self.lookup = lookup
+        self.gap_penalty = gap_penalty
+        self.columns = score.shape[1] - 1
+
+    def __len__(self):
+        return (self.score.shape[0] - 1) * self.columns
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[k] for k in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("step index out of range")
+
+        i = index // self.columns + 1
+        j = index % self.columns + 1
+        score = self.score
+
+        match = int(score[i - 1, j - 1]) + int(self.lookup[self.codes2[i - 1], self.codes1[j - 1]])
+
+        # Same precedence as the cell-by-cell implementation
+        flags = self.directions[i, j]
+        if flags & ZERO:
+            source = 'zero'
+        elif flags & DIAGONAL:
+            source = 'diagonal'
+        elif flags & UP:
+            source = 'up'
+        else:
+            source = 'left'
+
+        delete, insert = self._gap_scores(i, j)
+        return {
+            'i': i,
+            'j': j,
+            'score': int(score[i, j]),
+            'match': match,
+            'delete': delete,
+            'insert': insert,
+            'source': source
+        }
+
+    def _gap_scores(self, i, j):
+        """Returns the vertical (delete) and horizontal (insert) candidates of a cell"""
+        return (int(self.score[i - 1, j]) + self.gap_penalty,
+                int(self.score[i, j - 1]) + self.gap_penalty)
+
+
+def compute_needleman_wunsch(seq1, seq2, match_award, mismatch_penalty, gap_penalty, substitution=None):
     """
     Computes the entire Needleman-Wunsch matrix efficiently
+    A substitution matrix (object or name such as "BLOSUM62") replaces match/mismatch
     Returns the score matrix and the steps for visualization
     """
     n = len(seq1)
@@ -17,55 +243,36 @@ def compute_needleman_wunsch(seq1, seq2, match_award, mismatch_penalty, gap_pena
     score = np.zeros((m + 1, n + 1), dtype=int)
 
     # Initialize first row and column
-    for i in range(m + 1):
-        score[i, 0] = gap_penalty * i
-    for j in range(n + 1):
-        score[0, j] = gap_penalty * j
+    score[:, 0] = gap_penalty * np.arange(m + 1)
+    score[0, :] = gap_penalty * np.arange(n + 1)
 
-    # Record steps for animation
-    steps = []
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    table = _substitution_table(codes1, codes2, lookup)
+    _fill_rows(score, table, gap_penalty, local=False)
 
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            # Calculate match score
-            if seq1[j - 1] == seq2[i - 1]:
-                match = score[i - 1, j - 1] + match_award
-            else:
-                match = score[i - 1, j - 1] + mismatch_penalty
-
-            delete = score[i - 1, j] + gap_penalty
-            insert = score[i, j - 1] + gap_penalty
-
-            # Determine the best score
-            max_score = max(match, delete, insert)
-            score[i, j] = max_score
-
-            # Record which was the source of this score for traceback
-            source = None
-            if max_score == match:
-                source = 'diagonal'
-            elif max_score == delete:
-                source = 'up'
-            else:
-                source = 'left'
-
-            # Save this step for animation
-            steps.append({
-                'i': i,
-                'j': j,
-                'score': max_score,
-                'match': match,
-                'delete': delete,
-                'insert': insert,
-                'source': source
-            })
+    # Steps for animation are rebuilt lazily from the direction matrix
+    directions = _direction_matrix(score, table, gap_penalty, local=False)
+    steps = AlignmentSteps(score, directions, codes1, codes2, lookup, gap_penalty)
 
     return score, steps
 
 
-def compute_smith_waterman(seq1, seq2, match_award, mismatch_penalty, gap_penalty):
+def _max_position(score):
+    """
+    Returns the first maximum cell in row-major order, or (0, 0) if all are zero
+    """
+    m, n = score.shape[0] - 1, score.shape[1] - 1
+    if m == 0 or n == 0 or score.max() <= 0:
+        return 0, 0
+
+    max_i, max_j = np.unravel_index(np.argmax(score[1:, 1:]), (m, n))
+    return int(max_i) + 1, int(max_j) + 1
+
+
+def compute_smith_waterman(seq1, seq2, match_award, mismatch_penalty, gap_penalty, substitution=None):
     """
     Computes the entire Smith-Waterman matrix efficiently
+    A substitution matrix (object or name such as "BLOSUM62") replaces match/mismatch
     Returns the score matrix, steps for visualization, and max position
     """
     n = len(seq1)
@@ -74,152 +281,1208 @@ def compute_smith_waterman(seq1, seq2, match_award, mismatch_penalty, gap_penalt
     # Initialize matrices
     score = np.zeros((m + 1, n + 1), dtype=int)
 
-    # Record steps for animation
-    steps = []
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    table = _substitution_table(codes1, codes2, lookup)
+    _fill_rows(score, table, gap_penalty, local=True)
+
+    # Steps for animation are rebuilt lazily from the direction matrix
+    directions = _direction_matrix(score, table, gap_penalty, local=True)
+    steps = AlignmentSteps(score, directions, codes1, codes2, lookup, gap_penalty)
+
+    return score, steps, _max_position(score)
+
+
+def _iter_score_rows(row_codes, col_codes, lookup, gap_penalty, local):
+    """
+    Yields the DP rows one at a time while keeping only two rolling rows
+    The yielded array is reused for the row after next, so copy it to keep it
+    """
+    n = len(col_codes)
+    ramp = gap_penalty * np.arange(n + 1)
+    profile = lookup[:, col_codes]
+
+    previous = np.zeros(n + 1, dtype=int) if local else ramp.copy()
+    current = np.empty(n + 1, dtype=int)
+    yield previous
+
+    for i in range(1, len(row_codes) + 1):
+        # The diagonal scores of a row are one gather from the query profile
+        np.add(profile[row_codes[i - 1]], previous[:-1], out=current[1:])
+        np.maximum(current[1:], previous[1:] + gap_penalty, out=current[1:])
+        current[0] = 0 if local else gap_penalty * i
+        if local:
+            np.maximum(current, 0, out=current)
+
+        # Horizontal gaps: H[j] = max over k <= j of (H[k] + gap * (j - k))
+        current -= ramp
+        np.maximum.accumulate(current, out=current)
+        current += ramp
+
+        yield current
+        previous, current = current, previous
+
+
+def compute_needleman_wunsch_score(seq1, seq2, match_award, mismatch_penalty, gap_penalty, substitution=None):
+    """
+    Computes only the optimal Needleman-Wunsch score in linear memory
+    Keeps two rolling rows over the shorter sequence instead of the full matrix
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+
+    # The score is the same transposed, so iterate over the longer sequence
+    if len(codes1) > len(codes2):
+        codes1, codes2, lookup = codes2, codes1, lookup.T
+
+    for row in _iter_score_rows(codes2, codes1, lookup, gap_penalty, local=False):
+        pass
+    return int(row[-1])
+
+
+def compute_smith_waterman_score(seq1, seq2, match_award, mismatch_penalty, gap_penalty, substitution=None):
+    """
+    Computes only the best Smith-Waterman score and its end position in linear memory
+    Returns the max score and (max_i, max_j), the same cell compute_smith_waterman reports
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+
+    # Rows run over the longer sequence; when transposed, map coordinates back
+    transposed = len(codes1) > len(codes2)
+    if transposed:
+        codes1, codes2, lookup = codes2, codes1, lookup.T
 
-    # Variables to track maximum score
     max_score = 0
     max_i, max_j = 0, 0
 
+    rows = _iter_score_rows(codes2, codes1, lookup, gap_penalty, local=True)
+    for r, row in enumerate(rows):
+        c = int(np.argmax(row))
+        value = int(row[c])
+        if value == 0 or value < max_score:
+            continue
+
+        i, j = (c, r) if transposed else (r, c)
+
+        # Ties go to the first cell in row-major order of the full matrix
+        if value > max_score or (i, j) < (max_i, max_j):
+            max_score = value
+            max_i, max_j = i, j
+
+    return max_score, (max_i, max_j)
+
+
+def _last_score_row(codes1, codes2, lookup, gap_penalty):
+    """
+    Returns the last Needleman-Wunsch row (over seq1) of seq2 against seq1
+    """
+    for row in _iter_score_rows(codes2, codes1, lookup, gap_penalty, local=False):
+        pass
+    return row.copy()
+
+
+def _global_block_operations(codes1, codes2, lookup, gap_penalty):
+    """
+    Aligns a block with the full-matrix kernel and returns its operations
+    'M' consumes both sequences, 'D' only seq1 and 'I' only seq2
+    """
+    n = len(codes1)
+    m = len(codes2)
+
+    score = np.zeros((m + 1, n + 1), dtype=int)
+    score[:, 0] = gap_penalty * np.arange(m + 1)
+    score[0, :] = gap_penalty * np.arange(n + 1)
+
+    table = _substitution_table(codes1, codes2, lookup)
+    _fill_rows(score, table, gap_penalty, local=False)
+
+    operations, _ = _traceback_operations(codes1, codes2, lookup, gap_penalty, score, (m, n), local=False)
+    return operations
+
+
+def _hirschberg_operations(codes1, codes2, lookup, gap_penalty, threshold, operations):
+    """
+    Appends the operations of an optimal global alignment of the two blocks
+    """
+    n = len(codes1)
+    m = len(codes2)
+
+    if m == 0:
+        operations.extend('D' * n)
+        return
+    if n == 0:
+        operations.extend('I' * m)
+        return
+    if m == 1 or (m + 1) * (n + 1) <= threshold:
+        operations.extend(_global_block_operations(codes1, codes2, lookup, gap_penalty))
+        return
+
+    # Split seq2 in half and find where an optimal path crosses the middle row
+    mid = m // 2
+    forward = _last_score_row(codes1, codes2[:mid], lookup, gap_penalty)
+    backward = _last_score_row(codes1[::-1], codes2[mid:][::-1], lookup, gap_penalty)
+    total = forward + backward[::-1]
+
+    # Any maximizing column is optimal; above the threshold co-optimal ties may
+    # therefore resolve differently from the full-matrix traceback
+    split = int(np.argmax(total))
+
+    _hirschberg_operations(codes1[:split], codes2[:mid], lookup, gap_penalty, threshold, operations)
+    _hirschberg_operations(codes1[split:], codes2[mid:], lookup, gap_penalty, threshold, operations)
+
+
+def compute_hirschberg(seq1, seq2, match_award, mismatch_penalty, gap_penalty, threshold=HIRSCHBERG_THRESHOLD,
+                       substitution=None):
+    """
+    Computes an optimal Needleman-Wunsch alignment in linear space (Hirschberg)
+    Blocks of at most threshold cells are aligned with the full-matrix kernel
+    Returns the alignments and path in the format of get_traceback_needleman_wunsch
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+
+    operations = []
+    _hirschberg_operations(codes1, codes2, lookup, gap_penalty, threshold, operations)
+
+    return _render_operations(seq1, seq2, operations, (0, 0))
+
+
+def compute_smith_waterman_hirschberg(seq1, seq2, match_award, mismatch_penalty, gap_penalty,
+                                      threshold=HIRSCHBERG_THRESHOLD, substitution=None):
+    """
+    Computes an optimal Smith-Waterman alignment in linear space
+    A score-only pass finds the best score and its end cell, a pass over the
+    reversed prefixes finds where an alignment of that score ending there starts,
+    and Hirschberg aligns the block between the two globally
+    The end cell is the one compute_smith_waterman reports; among co-optimal
+    starts the one closest to it is taken
+    Returns a LocalAlignment
+    """
+    best, end_pos = compute_smith_waterman_score(seq1, seq2, match_award, mismatch_penalty, gap_penalty,
+                                                 substitution=substitution)
+    if best <= 0:
+        return LocalAlignment(0, "", "", [], (0, 0), (0, 0))
+
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    end_i, end_j = end_pos
+
+    # Global rows over the reversed prefixes score the alignments that end at
+    # end_pos; none can beat best, and the first cell reaching it is a start
+    rows = _iter_score_rows(codes2[:end_i][::-1], codes1[:end_j][::-1], lookup, gap_penalty, local=False)
+    for r, row in enumerate(rows):
+        reached = np.flatnonzero(row == best)
+        if len(reached):
+            start_pos = (end_i - r, end_j - int(reached[0]))
+            break
+
+    start_i, start_j = start_pos
+    operations = []
+    _hirschberg_operations(codes1[start_j:end_j], codes2[start_i:end_i], lookup, gap_penalty, threshold,
+                           operations)
+
+    align1, align2, path = _render_operations(seq1, seq2, operations, start_pos)
+    return LocalAlignment(best, align1, align2, path, start_pos, end_pos)
+
+
+def _smith_waterman_batch_group(codes1, codes2, lookup, gap_penalty):
+    """
+    Scores a group of pairs together on padded (pairs x columns) arrays
+    Each DP row of every pair advances with one set of NumPy operations
+    Returns the best scores and their (max_i, max_j) cells
+    """
+    count = len(codes1)
+    lengths1 = np.array([len(c) for c in codes1])
+    lengths2 = np.array([len(c) for c in codes2])
+    n = int(lengths1.max())
+    m = int(lengths2.max())
+
+    # Scores are bounded by the pair lengths, so narrow integers are enough; the
+    # bound leaves room for the gap ramp and the padding score below
+    limit = (n + m + 1) * max(int(np.abs(lookup).max()), abs(gap_penalty), 1)
+    for dtype in (np.int16, np.int32, np.int64):
+        if 3 * limit < np.iinfo(dtype).max:
+            break
+
+    # Padding columns score -limit against everything: a padded cell can only come
+    # from a real cell of the same pair through gaps, so it stays below it and never
+    # wins the row maximum or a tie with it
+    pad = lookup.shape[1]
+    table = np.full((lookup.shape[0] + 1, pad + 1), -limit, dtype=dtype)
+    table[:-1, :-1] = lookup
+
+    padded1 = np.full((count, n), pad, dtype=np.intp)
+    padded2 = np.full((count, m), pad, dtype=np.intp)
+    for k in range(count):
+        padded1[k, :lengths1[k]] = codes1[k]
+        padded2[k, :lengths2[k]] = codes2[k]
+
+    # Rows are kept as H[j] - gap * j, in which the horizontal gaps of a row are a
+    # plain running maximum; a diagonal move then gains its score minus one gap.
+    # Row a * count + k of the query profile holds symbol a against pair k's seq1
+    profile = (table[:, padded1] - gap_penalty).reshape(-1, n)
+    pair_rows = np.arange(count)
+
+    ramp = (gap_penalty * np.arange(n + 1)).astype(dtype)
+    floor = -ramp  # H >= 0
+    previous = floor[None, :].repeat(count, axis=0)
+    current = previous.copy()
+    row = np.empty((count, n + 1), dtype=dtype)
+    up = np.empty((count, n), dtype=dtype)
+    best = np.zeros(count, dtype=dtype)
+    max_i = np.zeros(count, dtype=np.int64)
+    max_j = np.zeros(count, dtype=np.int64)
+
     for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            # Calculate match score
-            if seq1[j - 1] == seq2[i - 1]:
-                match = score[i - 1, j - 1] + match_award
-            else:
-                match = score[i - 1, j - 1] + mismatch_penalty
-
-            delete = score[i - 1, j] + gap_penalty
-            insert = score[i, j - 1] + gap_penalty
-
-            # Determine the best score (with 0 floor for local alignment)
-            max_score_cell = max(0, match, delete, insert)
-            score[i, j] = max_score_cell
-
-            # Track global maximum for traceback starting point
-            if max_score_cell > max_score:
-                max_score = max_score_cell
-                max_i, max_j = i, j
-
-            # Record which was the source of this score for traceback
-            source = None
-            if max_score_cell == 0:
-                source = 'zero'
-            elif max_score_cell == match:
-                source = 'diagonal'
-            elif max_score_cell == delete:
-                source = 'up'
-            else:
-                source = 'left'
-
-            # Save this step for animation
-            steps.append({
-                'i': i,
-                'j': j,
-                'score': max_score_cell,
-                'match': match,
-                'delete': delete,
-                'insert': insert,
-                'source': source
-            })
-
-    return score, steps, (max_i, max_j)
-
-
-def get_traceback_needleman_wunsch(seq1, seq2, score):
+        np.add(previous[:, :-1], profile[padded2[:, i - 1] * count + pair_rows], out=current[:, 1:])
+        np.add(previous[:, 1:], gap_penalty, out=up)
+        np.maximum(current[:, 1:], up, out=current[:, 1:])
+        np.maximum(current, floor, out=current)
+        np.maximum.accumulate(current, axis=1, out=current)
+
+        # First maximum of the row, then strict improvement: row-major tie-break
+        np.add(current, ramp, out=row)
+        values = row.max(axis=1)
+        improved = (values > best) & (i <= lengths2)
+        if improved.any():
+            best[improved] = values[improved]
+            max_i[improved] = i
+            max_j[improved] = row[improved].argmax(axis=1)
+
+        previous, current = current, previous
+
+    return best.astype(np.int64), max_i, max_j
+
+
+def compute_smith_waterman_batch(pairs, match_award, mismatch_penalty, gap_penalty, substitution=None,
+                                 batch_size=1024):
     """
-    Generates the alignment and traceback path for Needleman-Wunsch
+    Computes the best Smith-Waterman score and end cell of many (seq1, seq2) pairs
+    Pairs are sorted by length and padded into groups of batch_size, and every
+    group advances all of its pairs together, one NumPy operation per DP step
+    Returns an array of scores and an (pairs x 2) array of (max_i, max_j), the same
+    values compute_smith_waterman_score reports for each pair
     """
-    i = len(seq2)
-    j = len(seq1)
-    align1 = ""
-    align2 = ""
+    pairs = list(pairs)
+    codes, lookup = _encode_many([seq for pair in pairs for seq in pair],
+                                 match_award, mismatch_penalty, substitution)
+    codes1 = codes[0::2]
+    codes2 = codes[1::2]
 
-    # Traceback path
-    path = []
+    scores = np.zeros(len(pairs), dtype=np.int64)
+    ends = np.zeros((len(pairs), 2), dtype=np.int64)
 
+    # Similar lengths share a group, which keeps the padding small
+    order = sorted(range(len(pairs)), key=lambda k: (len(codes2[k]), len(codes1[k])))
+    for start in range(0, len(order), batch_size):
+        group = order[start:start + batch_size]
+        group = [k for k in group if len(codes1[k]) and len(codes2[k])]
+        if not group:
+            continue
+
+        best, max_i, max_j = _smith_waterman_batch_group(
+            [codes1[k] for k in group], [codes2[k] for k in group], lookup, gap_penalty
+        )
+        scores[group] = best
+        ends[group, 0] = max_i
+        ends[group, 1] = max_j
+
+    return scores, ends
+
+
+def _xdrop_extend(codes1, codes2, lookup, gap_penalty, x_drop, z_drop):
+    """
+    Extends an alignment from the origin cell over anti-diagonals d = i + j
+    codes1 and codes2 are the residues in extension order (reversed views for a
+    leftward extension); cells scoring x_drop below the best so far are pruned
+    and the live range of the next anti-diagonal only spans the surviving cells
+    Returns the best score, its (i, j) cell, the operations from the origin to
+    that cell and the visited cells
+    """
+    n = len(codes1)
+    m = len(codes2)
+    best, best_i, best_j = 0, 0, 0
+
+    # Live anti-diagonals padded with minus infinity on both sides
+    previous = np.array([NEGATIVE_INFINITY, 0, NEGATIVE_INFINITY], dtype=np.int64)
+    before = np.full(3, NEGATIVE_INFINITY, dtype=np.int64)
+    lo1, hi1 = 0, 0
+    lo2 = 0
+
+    # (lo, scores) of every computed anti-diagonal; pruned cells hold minus infinity
+    diagonals = [(0, [0])]
+
+    # With one side empty only gaps remain, and gaps never raise the score
+    for d in range(1, n + m + 1 if n and m else 1):
+        lo = max(lo1, d - n)
+        hi = min(hi1 + 1, m)
+        if lo > hi:
+            break
+
+        # Residues of cells (i, d - i); the wrapped index at i = 0 or j = 0
+        # is harmless because the diagonal neighbour there is minus infinity
+        pairs = lookup[codes2[np.arange(lo - 1, hi)], codes1[np.arange(d - lo - 1, d - hi - 2, -1)]]
+        current = np.maximum(before[lo - lo2:hi - lo2 + 1] + pairs,
+                             np.maximum(previous[lo - lo1:hi - lo1 + 1], previous[lo - lo1 + 1:hi - lo1 + 2])
+                             + gap_penalty)
+
+        k = int(current.argmax())
+        top = int(current[k])
+        if top > best:
+            best, best_i, best_j = top, lo + k, d - lo - k
+        elif z_drop is not None and best - top > z_drop - gap_penalty * abs((lo + k - best_i) - (d - lo - k - best_j)):
+            diagonals.append((lo, current.tolist()))
+            break
+
+        # X-drop: prune, then shrink the live range to the surviving cells
+        dropped = current < best - x_drop
+        current[dropped] = NEGATIVE_INFINITY
+        diagonals.append((lo, current.tolist()))
+        live = np.flatnonzero(~dropped)
+        if not len(live):
+            break
+
+        before, lo2 = previous, lo1
+        lo1, hi1 = lo + int(live[0]), lo + int(live[-1])
+        previous = np.full(hi1 - lo1 + 3, NEGATIVE_INFINITY, dtype=np.int64)
+        previous[1:-1] = current[live[0]:live[-1] + 1]
+
+    def cell_score(i, j):
+        lo, scores = diagonals[i + j]
+        return scores[i - lo] if 0 <= i - lo < len(scores) else NEGATIVE_INFINITY
+
+    # Walk back from the best cell with the usual (diagonal, left, up) preference
+    pair_scores = lookup.tolist()
+    operations = []
+    i, j = best_i, best_j
     while i > 0 or j > 0:
-        path.append((i, j))
-        current = score[i, j]
-
-        if i > 0 and j > 0:
-            diagonal = score[i - 1, j - 1]
-            if seq1[j - 1] == seq2[i - 1]:
-                diagonal_score = diagonal + 1  # Assuming match=1; adjust as needed
-            else:
-                diagonal_score = diagonal - 1  # Assuming mismatch=-1; adjust as needed
-
-            # Check if diagonal move is optimal
-            if current == diagonal_score:
-                align1 = seq1[j - 1] + align1
-                align2 = seq2[i - 1] + align2
-                i -= 1
-                j -= 1
-                continue
+        current = cell_score(i, j)
+        if i > 0 and j > 0 and current == cell_score(i - 1, j - 1) + pair_scores[codes2[i - 1]][codes1[j - 1]]:
+            operations.append('M')
+            i -= 1
+            j -= 1
+        elif j > 0 and current == cell_score(i, j - 1) + gap_penalty:
+            operations.append('D')
+            j -= 1
+        else:
+            operations.append('I')
+            i -= 1
+    operations.reverse()
 
-        if j > 0:
-            # Check if horizontal move is optimal
-            left = score[i, j - 1]
-            if current == left - 1:  # Assuming gap=-1; adjust as needed
-                align1 = seq1[j - 1] + align1
-                align2 = '-' + align2
-                j -= 1
-                continue
+    lows = np.array([lo for lo, _ in diagonals])
+    widths = np.array([len(scores) for _, scores in diagonals])
+    visited_d = np.repeat(np.arange(len(diagonals)), widths)
+    visited_i = np.repeat(lows - np.cumsum(widths) + widths, widths) + np.arange(widths.sum())
+    visited = np.stack((visited_i, visited_d - visited_i), axis=1)
+
+    return best, (best_i, best_j), operations, visited
+
+
+def extend_seeds(seq1, seq2, seeds, match_award, mismatch_penalty, gap_penalty, x_drop=20, z_drop=None,
+                 substitution=None):
+    """
+    Extends seed matches in both directions with X-drop pruning
+    Each seed is (i, j, length): it aligns seq2[i:i + length] with seq1[j:j + length]
+    and the extension explores only cells within x_drop of the best score seen;
+    with z_drop set, it also stops once an anti-diagonal falls z_drop below the best
+    (plus the gap cost of the diagonal shift), which cuts off poor long gaps
+    The sequences are encoded once, so many seeds on a long reference are cheap
+    Returns a SeedExtension per seed
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    lookup = lookup.astype(np.int64)
+
+    extensions = []
+    for seed_i, seed_j, length in seeds:
+        if not (0 <= seed_i and seed_i + length <= len(codes2) and 0 <= seed_j and seed_j + length <= len(codes1)):
+            raise ValueError(f"Seed {(seed_i, seed_j, length)} lies outside the matrix")
 
-        # If we got here, vertical move must be optimal
-        align1 = '-' + align1
-        align2 = seq2[i - 1] + align2
-        i -= 1
+        seed_score = int(lookup[codes2[seed_i:seed_i + length], codes1[seed_j:seed_j + length]].sum())
+        end_i, end_j = seed_i + length, seed_j + length
 
-    # Return alignments and path in reverse (from start to end)
-    return align1, align2, list(reversed(path))
+        # Leftward extension runs on reversed views of the prefixes
+        back_score, (back_i, back_j), back_operations, back_visited = _xdrop_extend(
+            codes1[:seed_j][::-1], codes2[:seed_i][::-1], lookup, gap_penalty, x_drop, z_drop
+        )
+        forward_score, (forward_i, forward_j), forward_operations, forward_visited = _xdrop_extend(
+            codes1[end_j:], codes2[end_i:], lookup, gap_penalty, x_drop, z_drop
+        )
 
+        # Walking back towards the reversed origin moves forward in the matrix
+        back_operations.reverse()
+        operations = back_operations + ['M'] * length + forward_operations
+        start = (seed_i - back_i, seed_j - back_j)
+        end = (end_i + forward_i, end_j + forward_j)
+        align1, align2, path = _render_operations(seq1, seq2, operations, start)
 
-def get_traceback_smith_waterman(seq1, seq2, score, start_pos):
+        seed_cells = np.arange(1, length + 1)
+        visited = np.concatenate((
+            (seed_i, seed_j) - back_visited,
+            np.stack((seed_i + seed_cells, seed_j + seed_cells), axis=1),
+            (end_i, end_j) + forward_visited[1:],
+        ))
+
+        extensions.append(SeedExtension(back_score + seed_score + forward_score, start, end,
+                                        align1, align2, path, visited))
+
+    return extensions
+
+
+def extend_seed(seq1, seq2, seed, match_award, mismatch_penalty, gap_penalty, x_drop=20, z_drop=None,
+                substitution=None):
     """
-    Generates the alignment and traceback path for Smith-Waterman
+    Extends one (i, j, length) seed match in both directions with X-drop pruning
+    Returns a SeedExtension
     """
-    i, j = start_pos
-    align1 = ""
-    align2 = ""
+    return extend_seeds(seq1, seq2, [seed], match_award, mismatch_penalty, gap_penalty, x_drop, z_drop,
+                        substitution)[0]
 
-    # Traceback path
-    path = []
 
-    while i > 0 and j > 0 and score[i, j] > 0:
-        path.append((i, j))
-        current = score[i, j]
+def _fill_band(codes1, codes2, lookup, gap_penalty, lo, hi, local=False):
+    """
+    Fills the alignment matrix restricted to lo <= j - i <= hi, row by row
+    Returns the band scores and directions, indexed [i, j - i - lo]; the extra
+    last column stays at minus infinity so "up" neighbours need no bounds checks
+    """
+    n = len(codes1)
+    m = len(codes2)
+    width = hi - lo + 1
+
+    score = np.full((m + 1, width + 1), NEGATIVE_INFINITY, dtype=np.int64)
+    directions = np.zeros((m + 1, width + 1), dtype=np.uint8)
+    ramp = gap_penalty * np.arange(width)
+    profile = lookup[:, codes1]
 
-        # We stop when we hit a cell with score 0
-        if current == 0:
+    for i in range(m + 1):
+        # Band columns of this row that fall inside the matrix (0 <= j <= n)
+        a = max(0, -(lo + i))
+        b = min(width, n - lo - i + 1)
+        if a >= b:
+            continue
+        row = score[i, a:b]
+        flags = directions[i, a:b]
+
+        first = a
+        if i + lo + a == 0:
+            row[0] = 0 if local else gap_penalty * i
+            flags[0] = ZERO if local else (UP if i > 0 else 0)
+            first = a + 1
+
+        if i > 0 and first < b:
+            # Cells j >= 1: diagonal keeps the band column, up is one column right
+            j0 = i + lo + first
+            inner = slice(first - a, b - a)
+            diagonal = score[i - 1, first:b] + profile[codes2[i - 1], j0 - 1:j0 - 1 + b - first]
+            up = score[i - 1, first + 1:b + 1] + gap_penalty
+            np.maximum(diagonal, up, out=row[inner])
+            if local:
+                np.maximum(row[inner], 0, out=row[inner])
+            flags[inner] = (row[inner] == diagonal) * np.uint8(DIAGONAL) | (row[inner] == up) * np.uint8(UP)
+        elif i == 0:
+            row[first - a:] = 0 if local else gap_penalty * np.arange(i + lo + first, i + lo + b)
+
+        # Horizontal gaps: H[t] = max over t' <= t of (H[t'] + gap * (t - t'))
+        before = row.copy()
+        row -= ramp[a:b]
+        np.maximum.accumulate(row, out=row)
+        row += ramp[a:b]
+
+        if i == 0:
+            flags[first - a:] = LEFT
+        else:
+            flags[1:] &= (row[1:] == before[1:]).astype(np.uint8) * np.uint8(DIAGONAL | UP)
+            flags[1:] |= (row[1:] == row[:-1] + gap_penalty) * np.uint8(LEFT)
+
+        # A local alignment starts wherever the score drops back to zero
+        if local:
+            flags[row == 0] = ZERO
+
+    return score, directions
+
+
+def _band_operations(directions, lo, end_pos, local=False):
+    """
+    Walks the band directions back from end_pos with the usual preference
+    (diagonal, left, up)
+    Returns the operations from start to end and the (i, j) cell they start at
+    """
+    cols = directions.shape[1]
+    flags = memoryview(np.ascontiguousarray(directions).reshape(-1))
+
+    operations = []
+    i, j = end_pos
+    while (i > 0 and j > 0) if local else (i > 0 or j > 0):
+        cell = flags[i * cols + (j - i - lo)]
+        if local and cell & ZERO:
+            break
+        if cell & DIAGONAL:
+            operations.append('M')
+            i -= 1
+            j -= 1
+        elif cell & LEFT:
+            operations.append('D')
+            j -= 1
+        else:
+            operations.append('I')
+            i -= 1
+
+    operations.reverse()
+    return operations, (i, j)
+
+
+def compute_needleman_wunsch_banded(seq1, seq2, match_award, mismatch_penalty, gap_penalty, band=16,
+                                    substitution=None):
+    """
+    Computes a Needleman-Wunsch alignment inside a band around the main diagonal
+    Only cells with min(0, n-m) - band <= j - i <= max(0, n-m) + band are stored
+    The band doubles until no path leaving it can beat the banded score, so the
+    score always equals the unbanded optimum
+    Returns the score, the alignments and the traceback path
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    n = len(codes1)
+    m = len(codes2)
+    best_pair = int(lookup.max())
+
+    while True:
+        lo = min(0, n - m) - band
+        hi = max(0, n - m) + band
+        score, directions = _fill_band(codes1, codes2, lookup, gap_penalty, lo, hi)
+        best = int(score[m, n - m - lo])
+
+        # The band already covers the whole matrix
+        if lo <= -m and hi >= n:
+            break
+
+        # A path leaving the band has at least |n - m| + 2 * (band + 1) gaps; with g gaps
+        # it scores at most best_pair * (m + n - g) / 2 + gap * g, linear in g
+        least_gaps = abs(n - m) + 2 * (band + 1)
+        bound = max(best_pair * (m + n - g) + 2 * gap_penalty * g for g in (least_gaps, m + n))
+        if 2 * best >= bound:
+            break
+        band = max(2 * band, 1)
+
+    operations, start_pos = _band_operations(directions, lo, (m, n))
+    align1, align2, path = _render_operations(seq1, seq2, operations, start_pos)
+    return best, align1, align2, path
+
+
+def compute_smith_waterman_banded(seq1, seq2, match_award, mismatch_penalty, gap_penalty, lo, hi,
+                                  substitution=None):
+    """
+    Computes a Smith-Waterman alignment restricted to the band lo <= j - i <= hi
+    Unlike the global version the band is fixed: a local alignment only has to
+    lie near the diagonals a seed search pointed at
+    Returns the score, the alignments, the traceback path and the max position
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    n = len(codes1)
+    m = len(codes2)
+    lo = max(lo, -m)
+    hi = min(hi, n)
+    if n == 0 or m == 0 or lo > hi:
+        return 0, "", "", [], (0, 0)
+
+    score, directions = _fill_band(codes1, codes2, lookup, gap_penalty, lo, hi, local=True)
+
+    # First maximum in row-major order: band columns grow with j along a row
+    best = int(score.max())
+    if best <= 0:
+        return 0, "", "", [], (0, 0)
+    max_i, column = np.unravel_index(np.argmax(score), score.shape)
+    max_pos = (int(max_i), int(max_i) + lo + int(column))
+
+    operations, start_pos = _band_operations(directions, lo, max_pos, local=True)
+    align1, align2, path = _render_operations(seq1, seq2, operations, start_pos)
+    return best, align1, align2, path, max_pos
+
+
+def _traceback_operations(codes1, codes2, lookup, gap_penalty, score, end_pos, local, directions=None):
+    """
+    Walks back from end_pos over encoded sequences and collects the operations
+    """
+    codes1 = memoryview(np.ascontiguousarray(codes1))
+    codes2 = memoryview(np.ascontiguousarray(codes2))
+    pair_scores = lookup.tolist()
+
+    # Flat memoryviews make the per-cell lookups plain Python indexing
+    cols = score.shape[1]
+    cells = memoryview(np.ascontiguousarray(score, dtype=np.int64).reshape(-1))
+    flags = None
+    if directions is not None:
+        flags = memoryview(np.ascontiguousarray(directions, dtype=np.uint8).reshape(-1))
+
+    operations = []
+    i, j = end_pos
+    while (i > 0 and j > 0) if local else (i > 0 or j > 0):
+        index = i * cols + j
+        current = cells[index]
+        if local and current == 0:
             break
 
-        diagonal = score[i - 1, j - 1]
-        if seq1[j - 1] == seq2[i - 1]:
-            diagonal_score = diagonal + 1  # Assuming match=1; adjust as needed
+        if flags is not None:
+            diagonal = flags[index] & DIAGONAL
+            left = flags[index] & LEFT
         else:
-            diagonal_score = diagonal - 1  # Assuming mismatch=-1; adjust as needed
+            diagonal = False
+            if i > 0 and j > 0:
+                diagonal = current == cells[index - cols - 1] + pair_scores[codes2[i - 1]][codes1[j - 1]]
+            left = j > 0 and current == cells[index - 1] + gap_penalty
 
-        # Check if diagonal move is optimal
-        if current == diagonal_score:
-            align1 = seq1[j - 1] + align1
-            align2 = seq2[i - 1] + align2
+        if diagonal:
+            operations.append('M')
             i -= 1
             j -= 1
+        elif left:
+            operations.append('D')
+            j -= 1
+        else:
+            operations.append('I')
+            i -= 1
+
+    operations.reverse()
+    return operations, (i, j)
+
+
+def get_traceback_operations(seq1, seq2, score, end_pos, match_award, mismatch_penalty, gap_penalty,
+                             local=False, directions=None, substitution=None):
+    """
+    Walks back from end_pos and collects the alignment operations in linear time
+    'M' consumes both sequences, 'D' only seq1 (gap in seq2) and 'I' only seq2
+    Moves are checked against the real scoring parameters, or read from the
+    direction matrix when one is given; ties prefer diagonal, then left, then up
+    Returns the operations from start to end and the (i, j) cell they start at
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    return _traceback_operations(codes1, codes2, lookup, gap_penalty, score, end_pos, local, directions)
+
+
+def operations_to_cigar(operations):
+    """
+    Run-length encodes alignment operations as a CIGAR string (e.g. 5M1D3M)
+    seq1 plays the reference: 'D' is a gap in seq2 and 'I' a gap in seq1
+    """
+    cigar = []
+    count = 0
+    previous = None
+    for op in operations:
+        if op == previous:
+            count += 1
             continue
+        if previous is not None:
+            cigar.append(f"{count}{previous}")
+        previous = op
+        count = 1
+    if previous is not None:
+        cigar.append(f"{count}{previous}")
+    return "".join(cigar)
+
+
+def score_operations(seq1, seq2, operations, match_award, mismatch_penalty, gap_penalty, gap_extend=None,
+                     start_pos=(0, 0), substitution=None):
+    """
+    Scores alignment operations starting at start_pos with the given scoring
+    A gap run of length L costs gap_penalty + (L - 1) * gap_extend, which is
+    the linear model when gap_extend is None or equal to gap_penalty
+    'D' then 'I' (or 'I' then 'D') are two gaps, each opened on its own
+    """
+    if gap_extend is None:
+        gap_extend = gap_penalty
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+
+    ops = np.frombuffer("".join(operations).encode(), dtype=np.uint8)
+    pairs = ops == ord('M')
+    gaps = ~pairs
+    opened = gaps.copy()
+    opened[1:] &= ops[1:] != ops[:-1]
+
+    # Sequence positions of the aligned pairs
+    start_i, start_j = start_pos
+    j = start_j + np.cumsum(ops != ord('I')) - 1
+    i = start_i + np.cumsum(ops != ord('D')) - 1
+    total = int(lookup[codes2[i[pairs]], codes1[j[pairs]]].sum(dtype=np.int64))
+
+    opens = int(np.count_nonzero(opened))
+    return total + opens * gap_penalty + (int(np.count_nonzero(gaps)) - opens) * gap_extend
+
+
+def _render_operations(seq1, seq2, operations, start_pos):
+    """
+    Builds the alignment strings and traceback path for a list of operations
+    The path lists the cell reached by every operation, from start to end
+    """
+    text1 = _sequence_text(seq1)
+    text2 = _sequence_text(seq2)
+    align1 = []
+    align2 = []
+    path = []
+
+    i, j = start_pos
+    for op in operations:
+        if op == 'M':
+            align1.append(text1[j])
+            align2.append(text2[i])
+            i += 1
+            j += 1
+        elif op == 'D':
+            align1.append(text1[j])
+            align2.append('-')
+            j += 1
+        else:
+            align1.append('-')
+            align2.append(text2[i])
+            i += 1
+        path.append((i, j))
+
+    return "".join(align1), "".join(align2), path
+
+
+def get_traceback_needleman_wunsch(seq1, seq2, score, match_award=1, mismatch_penalty=-1, gap_penalty=-1,
+                                   directions=None, substitution=None):
+    """
+    Generates the alignment and traceback path for Needleman-Wunsch
+    """
+    operations, start_pos = get_traceback_operations(
+        seq1, seq2, score, (len(seq2), len(seq1)), match_award, mismatch_penalty, gap_penalty,
+        local=False, directions=directions, substitution=substitution
+    )
+
+    # Return alignments and path from start to end
+    return _render_operations(seq1, seq2, operations, start_pos)
+
+
+def get_traceback_smith_waterman(seq1, seq2, score, start_pos, match_award=1, mismatch_penalty=-1, gap_penalty=-1,
+                                 directions=None, substitution=None):
+    """
+    Generates the alignment and traceback path for Smith-Waterman
+    """
+    operations, begin_pos = get_traceback_operations(
+        seq1, seq2, score, start_pos, match_award, mismatch_penalty, gap_penalty,
+        local=True, directions=directions, substitution=substitution
+    )
+
+    # Return alignments and path from start to end
+    return _render_operations(seq1, seq2, operations, begin_pos)
+
+
+def _refill_local_rows(score, table, gap_penalty, forbidden, first_row, first_col, last_changed_row):
+    """
+    Recomputes the local score matrix in place from first_row down, over columns
+    first_col onward, with forbidden cells pinned to zero
+    Cells above and to the left of the first forbidden cell cannot change, and once
+    a row past last_changed_row comes out unchanged every later row would too
+    Returns the end of the recomputed row range
+    """
+    m, n = score.shape[0] - 1, score.shape[1] - 1
+    c = first_col
+    ramp = gap_penalty * np.arange(n - c + 2)
+
+    # Gap runs along a row may not cross a forbidden cell: lifting each segment
+    # between forbidden cells above all earlier ones cuts the running maximum there
+    lift = int(score.max()) - gap_penalty * (n + 2) + 1
+
+    row = np.empty(n - c + 2, dtype=score.dtype)
+    for i in range(first_row, m + 1):
+        previous = score[i - 1]
+        row[0] = score[i, c - 1]
+        np.maximum(previous[c - 1:n] + table[i, c:], previous[c:] + gap_penalty, out=row[1:])
+        np.maximum(row[1:], 0, out=row[1:])
+
+        blocked = forbidden[i, c - 1:]
+        row[blocked] = 0
+        segments = np.cumsum(blocked) * lift
+        row -= ramp
+        row += segments
+        np.maximum.accumulate(row, out=row)
+        row -= segments
+        row += ramp
+        row[blocked] = 0
+
+        if i > last_changed_row and np.array_equal(row[1:], score[i, c:]):
+            return i
+        score[i, c:] = row[1:]
+
+    return m + 1
+
+
+def compute_waterman_eggert(seq1, seq2, match_award, mismatch_penalty, gap_penalty, k=1, substitution=None,
+                            score=None, directions=None):
+    """
+    Finds the k best local alignments that share no aligned cell (Waterman-Eggert)
+    After each hit its path cells are forbidden and only the rows below it are
+    recomputed, right of its first column, until a row comes out unchanged
+    The first hit is the usual Smith-Waterman alignment
+    score and directions, when given, are an already computed Smith-Waterman
+    matrix (and its direction flags) for the same inputs; score is copied, not
+    changed, and directions only guide the first traceback
+    Returns a list of LocalAlignment, best first; shorter than k once no
+    positive score is left
+    """
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    n = len(codes1)
+    m = len(codes2)
+
+    table = _substitution_table(codes1, codes2, lookup)
+    if score is None:
+        score = np.zeros((m + 1, n + 1), dtype=int)
+        _fill_rows(score, table, gap_penalty, local=True)
+    else:
+        # The refills below change the matrix, which may be a cached one
+        score = np.array(score, dtype=int)
+    forbidden = np.zeros((m + 1, n + 1), dtype=bool)
+
+    # Row maxima find the next hit without rescanning the matrix
+    row_best = score[:, 1:].max(axis=1) if n else np.zeros(m + 1, dtype=int)
+    row_column = score[:, 1:].argmax(axis=1) + 1 if n else np.zeros(m + 1, dtype=int)
+
+    hits = []
+    while len(hits) < k and m and n:
+        # First maximum in row-major order, as for a single alignment
+        max_i = int(np.argmax(row_best))
+        best = int(row_best[max_i])
+        if best <= 0:
+            break
+        end_pos = (max_i, int(row_column[max_i]))
+
+        # The direction flags only match the matrix until the first refill
+        operations, start_pos = _traceback_operations(codes1, codes2, lookup, gap_penalty, score, end_pos,
+                                                      local=True, directions=directions if not hits else None)
+        align1, align2, path = _render_operations(seq1, seq2, operations, start_pos)
+        hits.append(LocalAlignment(best, align1, align2, path, start_pos, end_pos))
+
+        if len(hits) < k:
+            rows, columns = np.array(path).T
+            forbidden[rows, columns] = True
+            stop = _refill_local_rows(score, table, gap_penalty, forbidden, path[0][0], path[0][1], path[-1][0])
+            changed = score[path[0][0]:stop, 1:]
+            row_best[path[0][0]:stop] = changed.max(axis=1)
+            row_column[path[0][0]:stop] = changed.argmax(axis=1) + 1
+
+    return hits
+
+
+class AffineAlignmentSteps(AlignmentSteps):
+    """
+    Step records of an affine-gap alignment
+    'delete' and 'insert' are the vertical and horizontal gap states of the cell
+    """
+
+    def __init__(self, score, directions, vertical, horizontal, codes1, codes2, lookup):
+        AlignmentSteps.__init__(self, score, directions, codes1, codes2, lookup, None)
+        self.vertical = vertical
+        self.horizontal = horizontal
+
+    def _gap_scores(self, i, j):
+        """Returns the vertical (delete) and horizontal (insert) gap states of a cell"""
+        return int(self.vertical[i, j]), int(self.horizontal[i, j])
+
+
+def _fill_rows_affine(score, vertical, horizontal, table, gap_open, gap_extend, local, progress=None):
+    """
+    Fills the three Gotoh states in place one row at a time
+    score holds the best of the three states (H); vertical and horizontal hold the
+    gap states ending with an up (F) or a left (E) move
+    As in _fill_rows the horizontal state of a row is a running maximum, and a
+    matrix taller than it is wide is filled through transposed copies, where
+    the two gap states trade places
+    progress, when given, is called with the fraction of rows filled
+    """
+    rows, cols = score.shape
+    if rows > cols:
+        copies = [np.ascontiguousarray(matrix.T) for matrix in (score, horizontal, vertical)]
+        _fill_rows_affine(*copies, np.ascontiguousarray(table.T), gap_open, gap_extend, local, progress)
+        for matrix, filled in zip((score, horizontal, vertical), copies):
+            matrix[...] = filled.T
+        return
+
+    # E either extends or, when that is cheaper, closes and reopens at once, so a
+    # step along a row costs the larger of the two
+    step = max(gap_open, gap_extend)
+    ramp = step * np.arange(cols)
+    best = np.empty(cols, dtype=score.dtype)
+
+    for i in range(1, rows):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress(i / rows)
+        current = score[i]
+        up = vertical[i]
+        left = horizontal[i]
+
+        # Vertical gaps: open from the best state above or extend the gap above
+        np.maximum(vertical[i - 1, 1:] + gap_extend, score[i - 1, 1:] + gap_open, out=up[1:])
+
+        # Best state without horizontal gaps
+        np.add(score[i - 1, :-1], table[i, 1:], out=current[1:])
+        np.maximum(current[1:], up[1:], out=current[1:])
+        if local:
+            np.maximum(current, 0, out=current)
+
+        # Horizontal gaps: E[j] = max over k < j of (H[k] + gap_open + step * (j - 1 - k)),
+        # or the gap state of column 0 extended, which matters when it is a block edge
+        np.subtract(current, ramp, out=best)
+        best[0] = max(best[0], left[0] + gap_extend - gap_open)
+        np.maximum.accumulate(best, out=best)
+        np.add(best[:-1], ramp[:-1] + gap_open, out=left[1:])
+        np.maximum(current[1:], left[1:], out=current[1:])
+
+
+def _direction_matrix_affine(score, vertical, horizontal, table, gap_open, local):
+    """
+    Derives the bit-packed directions of an affine alignment
+    DIAGONAL/UP/LEFT/ZERO tell which states reach the best score, UP_OPEN and
+    LEFT_OPEN tell that the gap state was opened here rather than extended
+    """
+    rows, cols = score.shape
+    directions = _boundary_directions(rows, cols, local, affine=True)
+
+    for top in range(1, rows, DIRECTION_BLOCK_ROWS):
+        bottom = min(top + DIRECTION_BLOCK_ROWS, rows)
+        cell = score[top:bottom, 1:]
+        up = vertical[top:bottom, 1:]
+        left = horizontal[top:bottom, 1:]
+        block = directions[top:bottom, 1:]
+
+        block |= (cell == score[top - 1:bottom - 1, :-1] + table[top:bottom, 1:]) * np.uint8(DIAGONAL)
+        block |= (cell == up) * np.uint8(UP)
+        block |= (cell == left) * np.uint8(LEFT)
+        block |= (up == score[top - 1:bottom - 1, 1:] + gap_open) * np.uint8(UP_OPEN)
+        block |= (left == score[top:bottom, :-1] + gap_open) * np.uint8(LEFT_OPEN)
+        if local:
+            block |= (cell == 0) * np.uint8(ZERO)
+
+    return directions
+
+
+def _affine_matrices(m, n, gap_open, gap_extend, local):
+    """
+    Returns the (m+1)x(n+1) Gotoh matrices with only their boundaries set
+    """
+    score = np.zeros((m + 1, n + 1), dtype=np.int64)
+    vertical = np.full((m + 1, n + 1), NEGATIVE_INFINITY, dtype=np.int64)
+    horizontal = np.full((m + 1, n + 1), NEGATIVE_INFINITY, dtype=np.int64)
+
+    # A global alignment starts with a single gap along each edge
+    if not local:
+        score[1:, 0] = gap_open + gap_extend * np.arange(m)
+        score[0, 1:] = gap_open + gap_extend * np.arange(n)
+        vertical[1:, 0] = score[1:, 0]
+        horizontal[0, 1:] = score[0, 1:]
+    return score, vertical, horizontal
+
+
+def _compute_affine(seq1, seq2, match_award, mismatch_penalty, gap_open, gap_extend, local, substitution):
+    """
+    Fills the Gotoh matrices and returns the best-state matrix and its steps
+    """
+    score, vertical, horizontal = _affine_matrices(len(seq2), len(seq1), gap_open, gap_extend, local)
+
+    codes1, codes2, lookup = _encode_sequences(seq1, seq2, match_award, mismatch_penalty, substitution)
+    table = _substitution_table(codes1, codes2, lookup)
+    _fill_rows_affine(score, vertical, horizontal, table, gap_open, gap_extend, local)
+
+    directions = _direction_matrix_affine(score, vertical, horizontal, table, gap_open, local)
+    steps = AffineAlignmentSteps(score, directions, vertical, horizontal, codes1, codes2, lookup)
+    return score, steps
+
+
+def compute_needleman_wunsch_affine(seq1, seq2, match_award, mismatch_penalty, gap_open, gap_extend,
+                                    substitution=None):
+    """
+    Computes the Needleman-Wunsch matrix with affine gaps (Gotoh)
+    A gap of length L costs gap_open + (L - 1) * gap_extend
+    Returns the score matrix and the steps for visualization
+    """
+    return _compute_affine(seq1, seq2, match_award, mismatch_penalty, gap_open, gap_extend,
+                           local=False, substitution=substitution)
+
 
-        # Check if horizontal move is optimal
-        left = score[i, j - 1]
-        if current == left - 1:  # Assuming gap=-1; adjust as needed
-            align1 = seq1[j - 1] + align1
-            align2 = '-' + align2
+def compute_smith_waterman_affine(seq1, seq2, match_award, mismatch_penalty, gap_open, gap_extend,
+                                  substitution=None):
+    """
+    Computes the Smith-Waterman matrix with affine gaps (Gotoh)
+    A gap of length L costs gap_open + (L - 1) * gap_extend
+    Returns the score matrix, steps for visualization, and max position
+    """
+    score, steps = _compute_affine(seq1, seq2, match_award, mismatch_penalty, gap_open, gap_extend,
+                                   local=True, substitution=substitution)
+    return score, steps, _max_position(score)
+
+
+def get_traceback_affine_operations(directions, end_pos, local=False):
+    """
+    Walks the three Gotoh states back from end_pos using the direction matrix
+    Returns the operations from start to end and the (i, j) cell they start at
+    """
+    cols = directions.shape[1]
+    flags = memoryview(np.ascontiguousarray(directions, dtype=np.uint8).reshape(-1))
+
+    operations = []
+    state = 'H'
+    i, j = end_pos
+    while (i > 0 and j > 0) if local else (i > 0 or j > 0):
+        cell = flags[i * cols + j]
+
+        if state == 'H':
+            if local and cell & ZERO:
+                break
+            # Same preference as the linear traceback: diagonal, left, up
+            if cell & DIAGONAL:
+                operations.append('M')
+                i -= 1
+                j -= 1
+                continue
+            state = 'E' if cell & LEFT else 'F'
+
+        if state == 'E':
+            operations.append('D')
+            if cell & LEFT_OPEN:
+                state = 'H'
             j -= 1
-            continue
+        else:
+            operations.append('I')
+            if cell & UP_OPEN:
+                state = 'H'
+            i -= 1
+
+    operations.reverse()
+    return operations, (i, j)
+
+
+def get_traceback_needleman_wunsch_affine(seq1, seq2, directions):
+    """
+    Generates the alignment and traceback path for affine Needleman-Wunsch
+    """
+    end_pos = (directions.shape[0] - 1, directions.shape[1] - 1)
+    operations, start_pos = get_traceback_affine_operations(directions, end_pos, local=False)
+    return _render_operations(seq1, seq2, operations, start_pos)
+
+
+def get_traceback_smith_waterman_affine(seq1, seq2, directions, start_pos):
+    """
+    Generates the alignment and traceback path for affine Smith-Waterman
+    """
+    operations, begin_pos = get_traceback_affine_operations(directions, start_pos, local=True)
+    return _render_operations(seq1, seq2, operations, begin_pos)
+
+
+def _common_prefix(codes, other):
+    """Returns the length of the common prefix of two code arrays"""
+    size = min(len(codes), len(other))
+    differences = np.flatnonzero(codes[:size] != other[:size])
+    return int(differences[0]) if len(differences) else size
+
+
+class IncrementalAligner:
+    """
+    Aligner with fixed scoring that reuses the matrices of its previous run
+    Row i of the DP only depends on seq2[:i] and column j on seq1[:j], so the block
+    spanned by the prefixes both runs share is copied and only the rows and columns
+    after it are filled, so an edit at the end of a long sequence only computes the
+    cells it changes (the reused block is still copied into the new matrices)
+    align() returns what compute_needleman_wunsch / compute_smith_waterman (or
+    their affine versions when gap_extend differs from gap_penalty) return
+    """
+
+    def __init__(self, match_award, mismatch_penalty, gap_penalty, gap_extend=None, local=False,
+                 substitution=None):
+        self.match_award = match_award
+        self.mismatch_penalty = mismatch_penalty
+        self.gap_penalty = gap_penalty
+        self.gap_extend = gap_penalty if gap_extend is None else gap_extend
+        self.local = local
+        self.substitution = substitution
+        self.affine = self.gap_extend != gap_penalty
+
+        self.reused = 0       # cells copied from the previous run by the last align()
+        self._previous = None  # (seq1 codes, seq2 codes, matrices, directions)
+
+    def align(self, seq1, seq2, progress=None):
+        """
+        Aligns seq1 (columns) against seq2 (rows), filling only what changed
+        since the previous call
+        progress, when given, is called as progress(cells filled, cells to fill)
+        while the matrices fill; an exception it raises abandons the run and
+        leaves the aligner as it was
+        """
+        raw1 = sequence_codes(seq1).copy()
+        raw2 = sequence_codes(seq2).copy()
+        n, m = len(raw1), len(raw2)
+
+        # Cells still valid are those above the shared prefix of seq2 and left of that of seq1
+        if self._previous is None:
+            prefix1 = prefix2 = 0
+        else:
+            previous1, previous2, previous_matrices, previous_directions = self._previous
+            prefix1 = _common_prefix(raw1, previous1)
+            prefix2 = _common_prefix(raw2, previous2)
 
-        # If we got here, vertical move must be optimal
-        align1 = '-' + align1
-        align2 = seq2[i - 1] + align2
-        i -= 1
+        if self.affine:
+            matrices = _affine_matrices(m, n, self.gap_penalty, self.gap_extend, self.local)
+        else:
+            score = np.zeros((m + 1, n + 1), dtype=int)
+            if not self.local:
+                score[:, 0] = self.gap_penalty * np.arange(m + 1)
+                score[0, :] = self.gap_penalty * np.arange(n + 1)
+            matrices = (score,)
+        directions = _boundary_directions(m + 1, n + 1, self.local, self.affine)
+
+        if self._previous is not None:
+            for matrix, previous in zip(matrices, previous_matrices):
+                matrix[:prefix2 + 1, :prefix1 + 1] = previous[:prefix2 + 1, :prefix1 + 1]
+            directions[1:prefix2 + 1, 1:prefix1 + 1] = previous_directions[1:prefix2 + 1, 1:prefix1 + 1]
+        self.reused = prefix1 * prefix2
+
+        codes1, codes2, lookup = _encode_sequences(raw1, raw2, self.match_award, self.mismatch_penalty,
+                                                   self.substitution)
+
+        # Progress of one block as cells of the whole run
+        total = n * m - prefix1 * prefix2
+
+        def block_progress(offset, cells):
+            if progress is None:
+                return None
+            return lambda fraction: progress(offset + int(fraction * cells), total)
+
+        # New columns beside the reused block first, as the new rows start from their last row
+        beside = prefix2 * (n - prefix1)
+        self._fill_block(matrices, directions, codes1, codes2, lookup, 0, prefix2, prefix1, n,
+                         block_progress(0, beside))
+        self._fill_block(matrices, directions, codes1, codes2, lookup, prefix2, m, 0, n,
+                         block_progress(beside, total - beside))
+        self._previous = (raw1, raw2, matrices, directions)
+
+        score = matrices[0]
+        if self.affine:
+            steps = AffineAlignmentSteps(score, directions, matrices[1], matrices[2], codes1, codes2, lookup)
+        else:
+            steps = AlignmentSteps(score, directions, codes1, codes2, lookup, self.gap_penalty)
+
+        if self.local:
+            return score, steps, _max_position(score)
+        return score, steps
+
+    def _fill_block(self, matrices, directions, codes1, codes2, lookup, top, bottom, left, right, progress=None):
+        """
+        Fills rows top+1..bottom and columns left+1..right of the matrices from
+        row top and column left, which must already hold their final values
+        progress is handed to the kernel, which reports the fraction filled, and
+        called once more with the block filled, before its directions are derived
+        """
+        if bottom <= top or right <= left:
+            return
+
+        # The kernels walk C-ordered matrices, so the block is filled in a copy
+        if self.affine:
+            block = [np.ascontiguousarray(matrix[top:bottom + 1, left:right + 1]) for matrix in matrices]
+            table = _substitution_table(codes1[left:right], codes2[top:bottom], lookup)
+            _fill_rows_affine(*block, table, self.gap_penalty, self.gap_extend, self.local, progress)
+            if progress is not None:
+                progress(1.0)
+            block_directions = _direction_matrix_affine(*block, table, self.gap_penalty, self.local)
+        else:
+            block = [np.ascontiguousarray(matrices[0][top:bottom + 1, left:right + 1])]
+            table = _substitution_table(codes1[left:right], codes2[top:bottom], lookup)
+            _fill_rows(block[0], table, self.gap_penalty, self.local, progress)
+            if progress is not None:
+                progress(1.0)
+            block_directions = _direction_matrix(block[0], table, self.gap_penalty, self.local)
 
-    # Return alignments and path in reverse (from start to end)
-    return align1, align2, list(reversed(path))
+        for matrix, filled in zip(matrices, block):
+            matrix[top + 1:bottom + 1, left + 1:right + 1] = filled[1:, 1:]
+        directions[top + 1:bottom + 1, left + 1:right + 1] = block_directions[1:, 1:]
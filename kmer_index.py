@@ -0,0 +1,263 @@
+"""
+k-mer index over target sequences for seed-and-extend local search
+The index is a set of NumPy arrays on disk: every k-mer key of every target in
+sorted order with its position, plus the concatenated target residues. It is
+built in key-range buckets so memory stays bounded, and loaded memory-mapped
+"""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from improved_algorithm import compute_smith_waterman_banded
+from search import SearchHit
+from substitution_matrices import sequence_codes
+
+# Symbols outside the index alphabet (N, X, ...) break the k-mers spanning them
+INVALID_SYMBOL = 255
+
+# Residues copied per step when the build moves temporary files into .npy arrays
+COPY_CHUNK = 1 << 24
+
+# On-disk record of one k-mer occurrence before it is sorted into its bucket
+_KMER_RECORD = np.dtype([("key", np.uint64), ("position", np.int64)])
+
+
+def _symbol_table(alphabet):
+    """Returns the 256-entry byte -> symbol index table of an alphabet"""
+    table = np.full(256, INVALID_SYMBOL, dtype=np.uint8)
+    for index, symbol in enumerate(alphabet):
+        table[ord(symbol.upper())] = index
+        table[ord(symbol.lower())] = index
+    return table
+
+
+class KmerIndex:
+    """
+    Sorted k-mer keys and positions over a set of targets
+    A pattern such as "1101011" gives a spaced seed: only the '1' positions of
+    each window are part of the key; a plain k-mer is the pattern "1" * k
+    """
+
+    def __init__(self, pattern, alphabet, keys, positions, residues, offsets, names):
+        self.pattern = pattern
+        self.alphabet = alphabet
+        self.keys = keys
+        self.positions = positions
+        self.residues = residues
+        self.offsets = offsets
+        self.names = names
+
+        self.table = _symbol_table(alphabet)
+        self.bits = max(1, int(np.ceil(np.log2(len(alphabet)))))
+        self.seed_offsets = np.array([k for k, c in enumerate(pattern) if c == "1"])
+        if self.bits * len(self.seed_offsets) > 64:
+            raise ValueError(f"A {len(self.seed_offsets)}-symbol seed over {len(alphabet)} symbols "
+                             f"does not fit a 64-bit key")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"KmerIndex({len(self)} targets, {len(self.keys)} seeds, pattern={self.pattern!r})"
+
+    def target(self, index):
+        """Returns the ascii codes of a target (a view of the residue array)"""
+        return self.residues[self.offsets[index]:self.offsets[index + 1]]
+
+    def kmers(self, residues, chunk_size=1 << 20):
+        """
+        Yields (keys, positions) of every valid seed of a residue array in chunks
+        of at most chunk_size windows, so long targets never expand all at once
+        """
+        span = len(self.pattern)
+        windows = len(residues) - span + 1
+        for start in range(0, max(windows, 0), chunk_size):
+            stop = min(start + chunk_size, windows)
+            codes = self.table[residues[start:stop + span - 1]]
+
+            keys = np.zeros(stop - start, dtype=np.uint64)
+            valid = np.ones(stop - start, dtype=bool)
+            for offset in self.seed_offsets:
+                column = codes[offset:offset + stop - start]
+                valid &= column != INVALID_SYMBOL
+                keys <<= np.uint64(self.bits)
+                keys |= column.astype(np.uint64)
+
+            yield keys[valid], start + np.flatnonzero(valid)
+
+    def seed_hits(self, query, max_occurrences=1000):
+        """
+        Looks up every seed of the query in the index
+        Seeds occurring more than max_occurrences times are skipped as repeats
+        Returns the (query position, target index, target position) of every hit
+        """
+        query_keys, query_positions = next(self.kmers(sequence_codes(query), chunk_size=len(query) + 1),
+                                           (np.zeros(0, np.uint64), np.zeros(0, np.int64)))
+
+        starts = np.searchsorted(self.keys, query_keys, side="left")
+        stops = np.searchsorted(self.keys, query_keys, side="right")
+        counts = stops - starts
+        counts[counts > max_occurrences] = 0
+
+        # Expand the [start, stop) run of every query seed into its index entries
+        total = int(counts.sum())
+        owners = np.repeat(np.arange(len(counts)), counts)
+        runs = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.asarray(self.positions[starts[owners] + runs])
+
+        targets = np.searchsorted(self.offsets, positions, side="right") - 1
+        return query_positions[owners], targets, positions - self.offsets[targets]
+
+    def search(self, query, match_award=1, mismatch_penalty=-1, gap_penalty=-1, substitution=None,
+               top_n=10, min_hits=2, band=16, max_occurrences=1000):
+        """
+        Seed-and-extend local search of one query against the indexed targets
+        Hits on diagonals (target position - query position) less than band apart
+        form one candidate; candidates with at least min_hits seeds get a banded
+        Smith-Waterman around their diagonals and each target keeps its best score
+        Returns SearchHits sorted by decreasing score, ties broken by target order
+        """
+        if top_n <= 0:
+            return []
+
+        query_positions, targets, target_positions = self.seed_hits(query, max_occurrences)
+        diagonals = target_positions - query_positions
+
+        # Clusters: runs of hits on one target whose sorted diagonals are close
+        order = np.lexsort((diagonals, targets))
+        targets = targets[order]
+        diagonals = diagonals[order]
+        breaks = np.ones(len(order), dtype=bool)
+        breaks[1:] = (targets[1:] != targets[:-1]) | (diagonals[1:] - diagonals[:-1] > band)
+        starts = np.flatnonzero(breaks)
+        stops = np.append(starts[1:], len(order))
+
+        best = {}
+        query_length = len(query)
+        for start, stop in zip(starts, stops):
+            if stop - start < min_hits:
+                continue
+
+            index = int(targets[start])
+            low, high = int(diagonals[start]), int(diagonals[stop - 1])
+
+            # Align only the target window the band can reach; in matrix terms the
+            # query is seq1 (columns j) and the window is seq2 (rows i)
+            target = self.target(index)
+            window = max(0, low - band)
+            window_end = min(len(target), high + band + query_length)
+            score, _, _, _, (end_i, end_j) = compute_smith_waterman_banded(
+                query, target[window:window_end], match_award, mismatch_penalty, gap_penalty,
+                window - high - band, window - low + band, substitution=substitution
+            )
+
+            if score > 0 and (index not in best or score > best[index][0]):
+                best[index] = (score, (end_i + window, end_j))
+
+        hits = [SearchHit(score, index, self.names[index], end) for index, (score, end) in best.items()]
+        hits.sort(key=lambda hit: (-hit.score, hit.index))
+        return hits[:top_n]
+
+
+def build_index(targets, directory, k=11, pattern=None, alphabet="ACGT", bucket_bits=6):
+    """
+    Builds a k-mer index over (name, sequence) targets into directory
+    Targets are streamed: their residues and seed records go to temporary files,
+    split into 2 ** bucket_bits buckets by the top bits of the key; each bucket is
+    then sorted on its own and appended, which leaves the keys globally sorted
+    Returns the index loaded from disk
+    """
+    pattern = pattern or "1" * k
+    os.makedirs(directory, exist_ok=True)
+
+    # An empty index only to reuse its seed extraction while building
+    builder = KmerIndex(pattern, alphabet, None, None, None, None, None)
+    shift = np.uint64(max(0, builder.bits * len(builder.seed_offsets) - bucket_bits))
+
+    names = []
+    offsets = [0]
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        residue_path = os.path.join(scratch, "residues.bin")
+        bucket_paths = [os.path.join(scratch, f"bucket{b}.bin") for b in range(1 << bucket_bits)]
+        buckets = [open(path, "wb") for path in bucket_paths]
+        try:
+            with open(residue_path, "wb") as residue_file:
+                for name, sequence in targets:
+                    residues = sequence_codes(sequence)
+                    residue_file.write(residues.tobytes())
+
+                    for keys, positions in builder.kmers(residues):
+                        records = np.empty(len(keys), dtype=_KMER_RECORD)
+                        records["key"] = keys
+                        records["position"] = positions + offsets[-1]
+
+                        # Records keep their position order inside a bucket
+                        owner = (keys >> shift).astype(np.int64)
+                        order = np.argsort(owner, kind="stable")
+                        bounds = np.searchsorted(owner[order], np.arange(len(buckets) + 1))
+                        for b in np.flatnonzero(np.diff(bounds)):
+                            records[order[bounds[b]:bounds[b + 1]]].tofile(buckets[b])
+
+                    names.append(name)
+                    offsets.append(offsets[-1] + len(residues))
+        finally:
+            for handle in buckets:
+                handle.close()
+
+        total = sum(os.path.getsize(path) for path in bucket_paths) // _KMER_RECORD.itemsize
+        keys = open_memmap(os.path.join(directory, "keys.npy"), mode="w+", dtype=np.uint64, shape=(total,))
+        positions = open_memmap(os.path.join(directory, "positions.npy"), mode="w+", dtype=np.int64,
+                                shape=(total,))
+        filled = 0
+        for path in bucket_paths:
+            records = np.fromfile(path, dtype=_KMER_RECORD)
+            order = np.argsort(records["key"], kind="stable")
+            keys[filled:filled + len(records)] = records["key"][order]
+            positions[filled:filled + len(records)] = records["position"][order]
+            filled += len(records)
+            os.remove(path)
+        keys.flush()
+        positions.flush()
+        del keys, positions
+
+        residues = open_memmap(os.path.join(directory, "residues.npy"), mode="w+", dtype=np.uint8,
+                               shape=(offsets[-1],))
+        with open(residue_path, "rb") as residue_file:
+            for start in range(0, offsets[-1], COPY_CHUNK):
+                chunk = np.frombuffer(residue_file.read(COPY_CHUNK), dtype=np.uint8)
+                residues[start:start + len(chunk)] = chunk
+        residues.flush()
+        del residues
+
+    np.save(os.path.join(directory, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(directory, "names.txt"), "w") as handle:
+        handle.writelines(f"{name}\n" for name in names)
+    with open(os.path.join(directory, "index.json"), "w") as handle:
+        json.dump({"pattern": pattern, "alphabet": alphabet}, handle)
+
+    return load_index(directory)
+
+
+def load_index(directory, mmap=True):
+    """
+    Loads an index saved by build_index
+    With mmap the large arrays stay on disk and pages are read on demand
+    """
+    mode = "r" if mmap else None
+    with open(os.path.join(directory, "index.json")) as handle:
+        meta = json.load(handle)
+    with open(os.path.join(directory, "names.txt")) as handle:
+        names = [line.rstrip("\n") for line in handle]
+
+    return KmerIndex(
+        meta["pattern"], meta["alphabet"],
+        np.load(os.path.join(directory, "keys.npy"), mmap_mode=mode),
+        np.load(os.path.join(directory, "positions.npy"), mmap_mode=mode),
+        np.load(os.path.join(directory, "residues.npy"), mmap_mode=mode),
+        np.load(os.path.join(directory, "offsets.npy")),
+        names,
+    )
@@ -1,10 +1,203 @@
 """
 Sequence Alignment Visualization Tool
 Main entry point for the application
+Without arguments the GUI starts; subcommands run without it
 """
 
-from app import AlgorithmApp
+import argparse
+import sys
+import time
+
+# Gap opening and extension used with --matrix when no gap cost is given, the
+# same as the GUI's BLOSUM62 scheme
+MATRIX_GAP_OPEN = -11
+MATRIX_GAP_EXTEND = -1
+
+
+def run_gui(args=None):
+    """Launch the Tk application"""
+    # Imported here so headless commands never load tkinter
+    from app import AlgorithmApp
 
-if __name__ == "__main__":
     app = AlgorithmApp()
     app.mainloop()
+
+
+def first_record(path):
+    """Returns the first (name, sequence) record of a FASTA file, exiting if it has none"""
+    from fasta import read_records
+
+    record = next(read_records(path), None)
+    if record is None:
+        sys.exit(f"no records in {path}")
+    return record
+
+
+def run_align(args):
+    """Align query records against target records and stream one line per pair"""
+    from fasta import read_records
+    from pipeline import (TSV_FIELDS, align_stream, format_cigar, format_jsonl, format_tsv, reference_pairs,
+                          write_lines, zip_pairs)
+
+    queries = read_records(args.queries)
+    if args.pairing == "first":
+        reference_name, reference = first_record(args.targets)
+        pairs = reference_pairs(queries, reference_name, reference)
+    else:
+        pairs = zip_pairs(queries, read_records(args.targets))
+
+    gap_open, gap_extend = gap_costs(args)
+    records = align_stream(
+        pairs, mode=args.mode, match_award=args.match, mismatch_penalty=args.mismatch, gap_penalty=gap_open,
+        substitution=args.matrix, processes=args.processes, batch_size=args.batch_size, gap_extend=gap_extend,
+        cache_dir=args.cache_dir
+    )
+
+    formatters = {"tsv": format_tsv, "jsonl": format_jsonl, "cigar": format_cigar}
+    header = "#" + "\t".join(TSV_FIELDS) if args.format == "tsv" else None
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        write_lines(map(formatters[args.format], records), output, header)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def run_search(args):
+    """Search the first query record against every target record"""
+    from fasta import read_records
+    from search import search_database
+
+    query_name, query = first_record(args.query)
+    gap_open, gap_extend = gap_costs(args)
+    hits = search_database(
+        query, read_records(args.targets), mode=args.mode,
+        match_award=args.match, mismatch_penalty=args.mismatch, gap_penalty=gap_open,
+        substitution=args.matrix, top_n=args.top, processes=args.processes, gap_extend=gap_extend,
+        cache_dir=args.cache_dir
+    )
+
+    print("#query\ttarget\tscore\ttarget_end\tquery_end")
+    for hit in hits:
+        target_end, query_end = hit.end if hit.end else ("", "")
+        print(f"{query_name}\t{hit.name}\t{hit.score}\t{target_end}\t{query_end}")
+
+
+def run_bench(args):
+    """Time the alignment kernels on random sequences and report cell updates per second"""
+    import numpy as np
+
+    import improved_algorithm as engine
+
+    rng = np.random.default_rng(args.seed)
+    alphabet = np.frombuffer(b"ACGT", dtype=np.uint8)
+    pairs = [(alphabet[rng.integers(0, 4, args.length)].tobytes().decode(),
+              alphabet[rng.integers(0, 4, args.length)].tobytes().decode()) for _ in range(args.pairs)]
+    scoring = (args.match, args.mismatch, gap_costs(args)[0])
+
+    kernels = {
+        "nw": lambda a, b: engine.compute_needleman_wunsch(a, b, *scoring),
+        "nw_score": lambda a, b: engine.compute_needleman_wunsch_score(a, b, *scoring),
+        "hirschberg": lambda a, b: engine.compute_hirschberg(a, b, *scoring),
+        "sw": lambda a, b: engine.compute_smith_waterman(a, b, *scoring),
+        "sw_hirschberg": lambda a, b: engine.compute_smith_waterman_hirschberg(a, b, *scoring),
+        "sw_score": lambda a, b: engine.compute_smith_waterman_score(a, b, *scoring),
+    }
+
+    print("#kernel\tlength\tpairs\tseconds\tcells_per_second")
+    cells = args.pairs * (args.length + 1) ** 2
+    for name in args.kernels or list(kernels) + ["sw_batch"]:
+        start = time.perf_counter()
+        if name == "sw_batch":
+            engine.compute_smith_waterman_batch(pairs, *scoring)
+        else:
+            for a, b in pairs:
+                kernels[name](a, b)
+        seconds = time.perf_counter() - start
+        print(f"{name}\t{args.length}\t{args.pairs}\t{seconds:.4f}\t{cells / seconds:.3e}")
+
+
+def add_scoring_arguments(parser, modes=True):
+    """Add the alignment mode and scoring options shared by the subcommands"""
+    if modes:
+        parser.add_argument("--mode", choices=("sw", "nw"), default="sw",
+                            help="local (sw) or global (nw) alignment")
+    parser.add_argument("--match", type=int, default=1, help="match reward")
+    parser.add_argument("--mismatch", type=int, default=-1, help="mismatch penalty")
+    parser.add_argument("--gap", type=int, default=None, help="linear gap penalty (default: -1)")
+    if modes:
+        parser.add_argument("--gap-open", type=int, default=None,
+                            help="score of a gap's first position (default: --gap); affine when it "
+                                 "differs from --gap-extend")
+        parser.add_argument("--gap-extend", type=int, default=None,
+                            help="score of every further gap position (default: --gap)")
+        parser.add_argument("--matrix", default=None,
+                            help=f"substitution matrix, e.g. BLOSUM62; without gap options it uses "
+                                 f"--gap-open {MATRIX_GAP_OPEN} --gap-extend {MATRIX_GAP_EXTEND}")
+
+
+def gap_costs(args):
+    """
+    Returns the (gap_open, gap_extend) the scoring options select
+    They are equal for linear gaps; --matrix alone gets protein gap costs
+    """
+    gap_open = getattr(args, "gap_open", None)
+    gap_extend = getattr(args, "gap_extend", None)
+    if args.gap is None and gap_open is None and gap_extend is None and getattr(args, "matrix", None):
+        return MATRIX_GAP_OPEN, MATRIX_GAP_EXTEND
+
+    gap = -1 if args.gap is None else args.gap
+    return (gap if gap_open is None else gap_open), (gap if gap_extend is None else gap_extend)
+
+
+def build_parser():
+    """Build the command line parser"""
+    parser = argparse.ArgumentParser(description="Sequence Alignment Visualization Tool")
+    parser.set_defaults(func=run_gui)
+    subparsers = parser.add_subparsers(title="commands")
+
+    align = subparsers.add_parser("align", help="align pairs of sequences from FASTA/FASTQ files")
+    align.add_argument("queries", help="FASTA/FASTQ file (optionally gzipped) of query sequences")
+    align.add_argument("targets", help="FASTA/FASTQ file (optionally gzipped) of target sequences")
+    align.add_argument("--pairing", choices=("zip", "first"), default="zip",
+                       help="align the k-th query with the k-th target (zip) or every query "
+                            "with the first target (first)")
+    add_scoring_arguments(align)
+    align.add_argument("--format", choices=("tsv", "jsonl", "cigar"), default="tsv", help="output format")
+    align.add_argument("--output", default=None, help="output file (default: standard output)")
+    align.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    align.add_argument("--batch-size", type=int, default=64, help="pairs sent to a worker at a time")
+    align.add_argument("--cache-dir", default=None, help="directory caching aligned pairs across runs")
+    align.set_defaults(func=run_align)
+
+    search = subparsers.add_parser("search", help="align one query against a FASTA database")
+    search.add_argument("query", help="FASTA file whose first record is the query")
+    search.add_argument("targets", help="FASTA file of target sequences")
+    add_scoring_arguments(search)
+    search.add_argument("--top", type=int, default=10, help="number of hits to report")
+    search.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    search.add_argument("--cache-dir", default=None, help="directory caching pair scores across runs")
+    search.set_defaults(func=run_search)
+
+    bench = subparsers.add_parser("bench", help="time the alignment kernels on random sequences")
+    bench.add_argument("--length", type=int, default=500, help="length of each random sequence")
+    bench.add_argument("--pairs", type=int, default=10, help="number of random pairs")
+    bench.add_argument("--kernels", nargs="+", default=None,
+                       choices=("nw", "nw_score", "hirschberg", "sw", "sw_hirschberg", "sw_score", "sw_batch"),
+                       help="kernels to time (default: all)")
+    bench.add_argument("--seed", type=int, default=0, help="random seed")
+    add_scoring_arguments(bench, modes=False)
+    bench.set_defaults(func=run_bench)
+
+    return parser
+
+
+def main(argv=None):
+    """Parse the command line and run the selected command"""
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
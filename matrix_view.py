@@ -0,0 +1,545 @@
+"""
+Virtualized drawing of an alignment matrix on a Tk canvas
+Only the cells in the visible part of the scroll region (plus a margin) have
+canvas items: a fixed pool sized to the window in which cell (i, j) always uses
+slot (i % rows, j % columns), so scrolling re-targets whole pool rows or columns
+and finding the items of a cell is two array reads
+Zoomed out, the matrix is a heatmap of image tiles instead of cells
+"""
+
+import tkinter as tk
+from collections import OrderedDict
+
+import numpy as np
+
+# Cells drawn beyond each edge of the window, so short scrolls move no items
+MARGIN_CELLS = 4
+
+# Background of a cell without a highlight
+DEFAULT_FILL = "white"
+
+LABEL_FONT = ("Helvetica", 10, "bold")
+
+# Line drawn through the cells of a traceback path, one segment per step
+PATH_COLOR = "#1B4F72"
+PATH_WIDTH = 2
+
+# Pixels per cell of the zoom levels after the first; level 0 is the per-cell view
+# at cell_size with numbers and letters, the others are heatmaps
+HEATMAP_SIZES = [16, 8, 4, 2, 1, 1 / 2, 1 / 4, 1 / 8]
+
+# Edge length in pixels of one heatmap tile (one PhotoImage)
+TILE_PIXELS = 128
+
+# Heatmap tiles kept over all zoom levels, least recently used dropped first
+MAX_TILES = 512
+
+# Heatmap colour ramp from the lowest to the highest score of the matrix
+HEATMAP_STOPS = [(49, 54, 149), (116, 173, 209), (255, 255, 191), (244, 109, 67), (165, 0, 38)]
+
+
+def _heatmap_table():
+    """Returns the 256 x 3 uint8 colour ramp through HEATMAP_STOPS"""
+    stops = np.array(HEATMAP_STOPS, dtype=float)
+    positions = np.linspace(0, 255, len(stops))
+    ramp = [np.interp(np.arange(256), positions, stops[:, channel]) for channel in range(3)]
+    return np.stack(ramp, axis=1).round().astype(np.uint8)
+
+
+HEATMAP_TABLE = _heatmap_table()
+
+
+def _block_max(array, step):
+    """Returns the maximum of every step x step block of a 2D array (edge blocks may be smaller)"""
+    rows, cols = array.shape
+    padded = np.zeros((-(-rows // step) * step, -(-cols // step) * step), dtype=array.dtype)
+    padded[:rows, :cols] = array
+
+    # Strided pairwise maxima, far faster than a reduction over a reshaped view
+    lines = padded[0::step].copy()
+    for offset in range(1, step):
+        np.maximum(lines, padded[offset::step], out=lines)
+    blocks = lines[:, 0::step].copy()
+    for offset in range(1, step):
+        np.maximum(blocks, lines[:, offset::step], out=blocks)
+    return blocks
+
+
+def _row_major_blocks(start, stop, width):
+    """
+    Splits the interior cells start..stop-1, numbered in row-major order from
+    cell (1, 1) over rows of width cells, into at most three rectangles
+    (top, bottom, left, right): a partial first row, full rows and a partial last row
+    """
+    blocks = []
+    while start < stop:
+        row, column = divmod(start, width)
+        if column or stop - start < width:
+            end = min(stop, (row + 1) * width)
+            blocks.append((row + 1, row + 2, column + 1, end - row * width + 1))
+            start = end
+        else:
+            rows = (stop - start) // width
+            blocks.append((row + 1, row + 1 + rows, 1, width + 1))
+            start += rows * width
+    return blocks
+
+
+class MatrixView:
+    """
+    Display state of a score matrix and the canvas items showing its visible part
+    The state is which cells show their value and the fill colour of each cell,
+    both held as arrays over the matrix; pages change it through the methods below
+    and the view keeps whatever is on screen in sync
+    Cell (i, j) is drawn at ((j + 1) * size, (i + 1) * size), size being the
+    pixels per cell of the zoom level
+    """
+
+    def __init__(self, canvas, h_scrollbar, v_scrollbar, cell_size=30):
+        self.canvas = canvas
+        self.h_scrollbar = h_scrollbar
+        self.v_scrollbar = v_scrollbar
+        self.cell_size = cell_size
+
+        self.seq1 = ""
+        self.seq2 = ""
+        self.score = None
+        self.revealed = np.zeros((0, 0), dtype=bool)
+        self.fills = np.zeros((0, 0), dtype=np.uint8)  # index into colors of every cell
+        self.colors = [DEFAULT_FILL]
+        self.rgb = [(255, 255, 255)]  # colors as 8-bit RGB for the heatmap
+        self.heat = None  # ramp index (0-255) of every cell's score, built on first heatmap use
+
+        self.level = 0
+        self.tiles = OrderedDict()  # (level, tile row, tile column) -> PhotoImage
+        self.tile_items = {}  # (tile row, tile column) -> (image id, PhotoImage) on the canvas
+
+        # Cell pool: item ids per slot and the matrix row / column each slot row / column shows
+        self.rectangles = np.zeros((0, 0), dtype=np.int64)
+        self.texts = np.zeros((0, 0), dtype=np.int64)
+        self.row_labels = np.zeros(0, dtype=np.int64)  # seq2 letter left of each slot row
+        self.column_labels = np.zeros(0, dtype=np.int64)  # seq1 letter above each slot column
+        self.slot_rows = np.zeros(0, dtype=np.int64)
+        self.slot_columns = np.zeros(0, dtype=np.int64)
+
+        self.path = []  # (i, j, fill index before the step, segment id or None) per path step
+        self.render_id = None
+
+        # Redraw whenever the visible part of the scroll region moves
+        canvas.config(xscrollcommand=self._on_xscroll, yscrollcommand=self._on_yscroll)
+        canvas.bind("<Configure>", lambda event: self.schedule_render())
+
+        # Ctrl + mouse wheel zooms (Button-4/5 are the wheel on X11)
+        canvas.bind("<Control-MouseWheel>", lambda event: self.zoom_in() if event.delta > 0 else self.zoom_out())
+        canvas.bind("<Control-Button-4>", lambda event: self.zoom_in())
+        canvas.bind("<Control-Button-5>", lambda event: self.zoom_out())
+
+    def _on_xscroll(self, first, last):
+        self.h_scrollbar.set(first, last)
+        self.schedule_render()
+
+    def _on_yscroll(self, first, last):
+        self.v_scrollbar.set(first, last)
+        self.schedule_render()
+
+    def reset(self, seq1, seq2, score):
+        """Shows a new matrix with only its boundary values revealed"""
+        self.clear()
+        self.seq1 = seq1
+        self.seq2 = seq2
+        self.score = score
+
+        rows, cols = len(seq2) + 1, len(seq1) + 1
+        self.revealed = np.zeros((rows, cols), dtype=bool)
+        self.revealed[0, :] = True
+        self.revealed[:, 0] = True
+        self.fills = np.zeros((rows, cols), dtype=np.uint8)
+        self.heat = None
+
+        self._set_scrollregion()
+        self.render()
+
+    @property
+    def size(self):
+        """Pixels per cell at the current zoom level"""
+        return self.cell_size if self.level == 0 else HEATMAP_SIZES[self.level - 1]
+
+    def _set_scrollregion(self):
+        rows, cols = self.revealed.shape
+        self.canvas.config(scrollregion=(0, 0, (cols + 1) * self.size + 1, (rows + 1) * self.size))
+
+    def zoom_in(self):
+        self.set_zoom(self.level - 1)
+
+    def zoom_out(self):
+        self.set_zoom(self.level + 1)
+
+    def set_zoom(self, level):
+        """Switches zoom level, keeping the cell at the centre of the window in place"""
+        level = min(max(level, 0), len(HEATMAP_SIZES))
+        if level == self.level:
+            return
+
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        center_x = (self.canvas.canvasx(0) + width / 2) / self.size
+        center_y = (self.canvas.canvasy(0) + height / 2) / self.size
+
+        # Cells and heatmap tiles never show together
+        self._build_pool(0, 0)
+        for item, _ in self.tile_items.values():
+            self.canvas.delete(item)
+        self.tile_items = {}
+
+        self.level = level
+        if self.score is None:
+            return
+        self._set_scrollregion()
+        rows, cols = self.revealed.shape
+        self.canvas.xview_moveto(max(0, center_x * self.size - width / 2) / ((cols + 1) * self.size + 1))
+        self.canvas.yview_moveto(max(0, center_y * self.size - height / 2) / ((rows + 1) * self.size))
+
+        for k, (i, j, _, segment) in enumerate(self.path):
+            if segment is not None:
+                self.canvas.coords(segment, *self._center(*self.path[k - 1][:2]), *self._center(i, j))
+        self.render()
+
+    def clear(self):
+        """Removes the matrix and every canvas item"""
+        if self.render_id is not None:
+            self.canvas.after_cancel(self.render_id)
+            self.render_id = None
+        self.canvas.delete("all")
+        self.score = None
+        self.revealed = np.zeros((0, 0), dtype=bool)
+        self.fills = np.zeros((0, 0), dtype=np.uint8)
+        self.heat = None
+        self.tiles.clear()
+        self.tile_items = {}
+        self.path = []
+        self._forget_pool(0, 0)
+
+    def reveal(self, i, j, shown=True):
+        """Shows (or hides) the value of a cell"""
+        self.revealed[i, j] = shown
+        self._invalidate(i, j)
+        slot = self._slot(i, j)
+        if slot is not None:
+            self.canvas.itemconfig(int(self.texts[slot]), text=self._cell_text(i, j))
+
+    def color_index(self, color):
+        """Returns the index of a fill colour, adding it to the palette"""
+        if color not in self.colors:
+            self.colors.append(color)
+            self.rgb.append(tuple(channel >> 8 for channel in self.canvas.winfo_rgb(color)))
+        return self.colors.index(color)
+
+    def highlight(self, i, j, color):
+        """Fills a cell with a highlight colour"""
+        self._set_fill(i, j, self.color_index(color))
+
+    def clear_highlight(self, i, j):
+        """Restores the plain background of a cell"""
+        self._set_fill(i, j, 0)
+
+    def _set_fill(self, i, j, index):
+        self.fills[i, j] = index
+        self._invalidate(i, j)
+        slot = self._slot(i, j)
+        if slot is not None:
+            self.canvas.itemconfig(int(self.rectangles[slot]), fill=self.colors[index])
+
+    def fill_range(self, start, stop, shown, color=None):
+        """
+        Reveals (or hides) the interior cells start..stop-1, counted in row-major
+        order from cell (1, 1) as the pages compute them, and gives them a
+        highlight colour (or the plain background)
+        Costs one array slice per row-major block, whatever the number of cells
+        """
+        index = 0 if color is None else self.color_index(color)
+        width = self.revealed.shape[1] - 1
+        for top, bottom, left, right in _row_major_blocks(start, stop, width):
+            self.revealed[top:bottom, left:right] = shown
+            self.fills[top:bottom, left:right] = index
+            self._invalidate_block(top, bottom, left, right)
+
+        # Redraw the pool slots showing a changed cell
+        rows, cols = self.rectangles.shape
+        if rows == 0 or start >= stop:
+            return
+        cells = (self.slot_rows[:, None] - 1) * width + (self.slot_columns[None, :] - 1)
+        changed = (self.slot_rows[:, None] > 0) & (self.slot_columns[None, :] > 0) & (cells >= start) & (cells < stop)
+        for r, c in zip(*np.nonzero(changed)):
+            self._draw_slot(r, c)
+
+    def clear_highlights(self):
+        """Restores the plain background of every cell and removes the traceback path"""
+        self.fills[:] = 0
+        self.tiles.clear()
+        self.canvas.delete("path")
+        self.path = []
+        self.schedule_render()
+        for rectangle in self.rectangles.flat:
+            self.canvas.itemconfig(int(rectangle), fill=DEFAULT_FILL)
+
+    def add_path_step(self, i, j, color):
+        """
+        Highlights the next cell of a traceback path and draws the segment to it
+        from the previous step, when that was a neighbouring cell of the same path
+        """
+        index = self.color_index(color)
+        segment = None
+        if self.path:
+            previous_i, previous_j = self.path[-1][:2]
+            if max(abs(i - previous_i), abs(j - previous_j)) == 1 and self.fills[previous_i, previous_j] == index:
+                segment = self.canvas.create_line(*self._center(previous_i, previous_j), *self._center(i, j),
+                                                  fill=PATH_COLOR, width=PATH_WIDTH, tags="path")
+        self.path.append((i, j, self.fills[i, j], segment))
+        self._set_fill(i, j, index)
+
+    def remove_path_step(self):
+        """Takes back the last traceback step, restoring the cell's earlier fill"""
+        i, j, previous, segment = self.path.pop()
+        if segment is not None:
+            self.canvas.delete(segment)
+        self._set_fill(i, j, previous)
+
+    def _center(self, i, j):
+        return (j + 1.5) * self.size, (i + 1.5) * self.size
+
+    def _invalidate(self, i, j):
+        """Drops the cached heatmap tiles showing cell (i, j)"""
+        for level in range(1, len(HEATMAP_SIZES) + 1):
+            span = self._tile_span(level)
+            self.tiles.pop((level, i // span, j // span), None)
+        if self.level > 0:
+            self.schedule_render()
+
+    def _invalidate_block(self, top, bottom, left, right):
+        """Drops the cached heatmap tiles showing any cell of rows [top, bottom) and columns [left, right)"""
+        for key in list(self.tiles):
+            level, ty, tx = key
+            span = self._tile_span(level)
+            if ty * span < bottom and (ty + 1) * span > top and tx * span < right and (tx + 1) * span > left:
+                del self.tiles[key]
+        if self.level > 0:
+            self.schedule_render()
+
+    def schedule_render(self):
+        """Redraws the visible cells once the pending events are handled"""
+        if self.render_id is None and self.score is not None:
+            self.render_id = self.canvas.after_idle(self.render)
+
+    def visible_window(self):
+        """Returns the rows [top, bottom) and columns [left, right) to draw"""
+        size = self.size
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        x1 = x0 + self.canvas.winfo_width()
+        y1 = y0 + self.canvas.winfo_height()
+
+        rows, cols = self.revealed.shape
+        top = max(0, int(y0 // size) - 1 - MARGIN_CELLS)
+        bottom = min(rows, int(y1 // size) + MARGIN_CELLS)
+        left = max(0, int(x0 // size) - 1 - MARGIN_CELLS)
+        right = min(cols, int(x1 // size) + MARGIN_CELLS)
+        return top, bottom, left, right
+
+    def render(self):
+        """Brings the visible part of the canvas up to date with the state"""
+        self.render_id = None
+        if self.score is None:
+            return
+        if self.level == 0:
+            self._render_cells()
+        else:
+            self._render_heatmap()
+
+    def _slot(self, i, j):
+        """Returns the pool slot showing cell (i, j), or None when it is not drawn"""
+        rows, cols = self.rectangles.shape
+        if rows == 0:
+            return None
+        r, c = i % rows, j % cols
+        if self.slot_rows[r] != i or self.slot_columns[c] != j:
+            return None
+        return r, c
+
+    def _forget_pool(self, rows, cols):
+        """Resets the pool bookkeeping to an empty rows x cols pool"""
+        self.rectangles = np.zeros((rows, cols), dtype=np.int64)
+        self.texts = np.zeros((rows, cols), dtype=np.int64)
+        self.row_labels = np.zeros(rows, dtype=np.int64)
+        self.column_labels = np.zeros(cols, dtype=np.int64)
+        self.slot_rows = np.full(rows, -1, dtype=np.int64)
+        self.slot_columns = np.full(cols, -1, dtype=np.int64)
+
+    def _build_pool(self, rows, cols):
+        """Replaces the cell pool by a rows x cols one of hidden items"""
+        old = [self.rectangles, self.texts, self.row_labels, self.column_labels]
+        ids = [int(item) for items in old for item in items.flat]
+        if ids:
+            self.canvas.delete(*ids)
+
+        self._forget_pool(rows, cols)
+        for r in range(rows):
+            for c in range(cols):
+                self.rectangles[r, c] = self.canvas.create_rectangle(0, 0, 0, 0, fill=DEFAULT_FILL, outline="black",
+                                                                     state="hidden")
+                self.texts[r, c] = self.canvas.create_text(0, 0, text="", state="hidden")
+        for r in range(rows):
+            self.row_labels[r] = self.canvas.create_text(0, 0, text="", font=LABEL_FONT, state="hidden")
+        for c in range(cols):
+            self.column_labels[c] = self.canvas.create_text(0, 0, text="", font=LABEL_FONT, state="hidden")
+        if rows:
+            self.canvas.tag_raise("path")
+
+    def _render_cells(self):
+        """Re-targets the pool rows and columns whose cells left the window to the ones that entered it"""
+        size = self.cell_size
+        rows, cols = self.revealed.shape
+        shape = (min(rows, self.canvas.winfo_height() // size + 2 * MARGIN_CELLS + 2),
+                 min(cols, self.canvas.winfo_width() // size + 2 * MARGIN_CELLS + 2))
+        if self.rectangles.shape != shape:
+            self._build_pool(*shape)
+        pool_rows, pool_cols = shape
+
+        top, bottom, left, right = self.visible_window()
+        moved_rows = [i % pool_rows for i in range(top, bottom) if self.slot_rows[i % pool_rows] != i]
+        moved_cols = [j % pool_cols for j in range(left, right) if self.slot_columns[j % pool_cols] != j]
+        for i in range(top, bottom):
+            self.slot_rows[i % pool_rows] = i
+        for j in range(left, right):
+            self.slot_columns[j % pool_cols] = j
+
+        for r in moved_rows:
+            self._draw_row_label(r)
+            for c in range(pool_cols):
+                self._draw_slot(r, c)
+        skip = set(moved_rows)
+        for c in moved_cols:
+            self._draw_column_label(c)
+            for r in range(pool_rows):
+                if r not in skip:
+                    self._draw_slot(r, c)
+
+    @staticmethod
+    def _tile_span(level):
+        """Returns the cells along one edge of a heatmap tile at a zoom level"""
+        return int(TILE_PIXELS / HEATMAP_SIZES[level - 1])
+
+    def _render_heatmap(self):
+        """Shows the heatmap tiles overlapping the window, building missing ones"""
+        size = self.size
+        rows, cols = self.revealed.shape
+        span = self._tile_span(self.level)
+
+        x0 = self.canvas.canvasx(0) - size
+        y0 = self.canvas.canvasy(0) - size
+        x1 = x0 + self.canvas.winfo_width()
+        y1 = y0 + self.canvas.winfo_height()
+        tile_rows = range(max(0, int(y0 // TILE_PIXELS)), min(-(-rows // span), int(y1 // TILE_PIXELS) + 1))
+        tile_cols = range(max(0, int(x0 // TILE_PIXELS)), min(-(-cols // span), int(x1 // TILE_PIXELS) + 1))
+        visible = {(ty, tx) for ty in tile_rows for tx in tile_cols}
+
+        for key in [key for key in self.tile_items if key not in visible]:
+            self.canvas.delete(self.tile_items.pop(key)[0])
+
+        for ty, tx in visible:
+            image = self._tile(ty, tx)
+            if (ty, tx) in self.tile_items:
+                item, shown = self.tile_items[ty, tx]
+                if shown is not image:
+                    self.canvas.itemconfig(item, image=image)
+            else:
+                item = self.canvas.create_image(size + tx * TILE_PIXELS, size + ty * TILE_PIXELS,
+                                                image=image, anchor="nw")
+                self.canvas.tag_raise("path")
+            self.tile_items[ty, tx] = (item, image)
+
+    def _tile(self, ty, tx):
+        """Returns the PhotoImage of a heatmap tile at the current level, cached"""
+        key = (self.level, ty, tx)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        pixels = self._tile_pixels(ty, tx)
+        header = f"P6 {pixels.shape[1]} {pixels.shape[0]} 255\n".encode()
+        image = tk.PhotoImage(master=self.canvas, width=pixels.shape[1], height=pixels.shape[0],
+                              data=header + pixels.tobytes(), format="PPM")
+
+        self.tiles[key] = image
+        while len(self.tiles) > MAX_TILES:
+            self.tiles.popitem(last=False)
+        return image
+
+    def _tile_pixels(self, ty, tx):
+        """
+        Returns the height x width x 3 RGB pixels of a heatmap tile
+        Revealed cells take the score ramp colour, hidden ones stay white and
+        highlighted ones take their highlight colour. Zoomed below one pixel per
+        cell, a pixel shows the highest revealed score of the cells it covers and
+        the highlight added to the palette last, so traceback paths stay visible
+        """
+        if self.heat is None:
+            low, high = int(self.score.min()), int(self.score.max())
+            self.heat = ((self.score - low) * 255 // max(high - low, 1)).astype(np.uint8)
+
+        size = self.size
+        span = self._tile_span(self.level)
+        top, left = ty * span, tx * span
+        heat = self.heat[top:top + span, left:left + span]
+        revealed = self.revealed[top:top + span, left:left + span]
+        fills = self.fills[top:top + span, left:left + span]
+
+        if size < 1:
+            step = int(round(1 / size))
+            heat = _block_max(np.where(revealed, heat, 0), step)
+            fills = _block_max(fills, step)
+            revealed = _block_max(revealed, step)
+
+        pixels = HEATMAP_TABLE[heat]
+        pixels[~revealed] = 255
+        highlighted = fills > 0
+        pixels[highlighted] = np.array(self.rgb, dtype=np.uint8)[fills[highlighted]]
+
+        if size > 1:
+            pixels = pixels.repeat(size, axis=0).repeat(size, axis=1)
+        return np.ascontiguousarray(pixels)
+
+    def _cell_text(self, i, j):
+        return str(self.score[i, j]) if self.revealed[i, j] else ""
+
+    def _draw_slot(self, r, c):
+        """Moves the items of slot (r, c) onto the cell it now shows"""
+        i, j = int(self.slot_rows[r]), int(self.slot_columns[c])
+        rectangle, text = int(self.rectangles[r, c]), int(self.texts[r, c])
+        if i < 0 or j < 0:
+            self.canvas.itemconfig(rectangle, state="hidden")
+            self.canvas.itemconfig(text, state="hidden")
+            return
+
+        size = self.cell_size
+        x, y = (j + 1) * size, (i + 1) * size
+        self.canvas.coords(rectangle, x, y, x + size, y + size)
+        self.canvas.itemconfig(rectangle, fill=self.colors[self.fills[i, j]], state="normal")
+        self.canvas.coords(text, x + size / 2, y + size / 2)
+        self.canvas.itemconfig(text, text=self._cell_text(i, j), state="normal")
+
+    def _draw_row_label(self, r):
+        """Puts the seq2 letter of the row slot r now shows beside it (row 0 has none)"""
+        i, label = int(self.slot_rows[r]), int(self.row_labels[r])
+        if i < 1:
+            self.canvas.itemconfig(label, state="hidden")
+            return
+        self.canvas.coords(label, self.cell_size / 2, (i + 1.5) * self.cell_size)
+        self.canvas.itemconfig(label, text=self.seq2[i - 1], state="normal")
+
+    def _draw_column_label(self, c):
+        """Puts the seq1 letter of the column slot c now shows above it (column 0 has none)"""
+        j, label = int(self.slot_columns[c]), int(self.column_labels[c])
+        if j < 1:
+            self.canvas.itemconfig(label, state="hidden")
+            return
+        self.canvas.coords(label, (j + 1.5) * self.cell_size, self.cell_size / 2)
+        self.canvas.itemconfig(label, text=self.seq1[j - 1], state="normal")
@@ -3,8 +3,16 @@ Needleman-Wunsch algorithm implementation for sequence alignment visualization
 """
 
 import tkinter as tk
-from tkinter import Frame, Label, Entry, Button, StringVar, IntVar, Canvas, Scrollbar
-from improved_algorithm import compute_needleman_wunsch, get_traceback_needleman_wunsch
+from tkinter import Frame, Label, Entry, Button, StringVar, IntVar, Canvas, Scrollbar, Scale
+from alignment_cache import shared_cache
+from animator import FrameAnimator
+from background import BackgroundJob
+from matrix_view import MatrixView
+from improved_algorithm import get_traceback_needleman_wunsch, get_traceback_needleman_wunsch_affine
+
+# Fill of the cells computed so far
+COMPUTED_COLOR = "#D6EAF8"
+
 
 class PageOne(tk.Frame):
     """
@@ -17,6 +25,9 @@ class PageOne(tk.Frame):
 
         # Initialize parameters
         self.gap_penalty = -1
+        self.gap_extend = -1
+        self.affine = False
+        self.substitution = None  # Name of a substitution matrix replacing match/mismatch
         self.match_award = 1
         self.mismatch_penalty = -1
         self.seq1 = ""
@@ -28,7 +39,10 @@ class PageOne(tk.Frame):
         self.current_step_index = 0
         self.animation_in_progress = False
         self.animation_completed_matrix = False
+        self.traceback_started = False
         self.traceback_path = []
+        self.highlighted_path = []
+        self.job = None  # background computation of the matrix, while it runs
         self.cell_size = 30  # Size of each cell in the grid
 
         # Create frames
@@ -45,14 +59,24 @@ class PageOne(tk.Frame):
         self.v_scrollbar = Scrollbar(self.canvas_frame)
         self.v_scrollbar.pack(side="right", fill="y")
 
-        self.canvas = Canvas(self.canvas_frame,
-                           xscrollcommand=self.h_scrollbar.set,
-                           yscrollcommand=self.v_scrollbar.set)
+        self.canvas = Canvas(self.canvas_frame)
         self.canvas.pack(side="left", fill="both", expand=True)
 
         self.h_scrollbar.config(command=self.canvas.xview)
         self.v_scrollbar.config(command=self.canvas.yview)
 
+        # The view draws only the visible cells and follows the scrollbars
+        self.view = MatrixView(self.canvas, self.h_scrollbar, self.v_scrollbar, self.cell_size)
+
+        # '>>' runs as many steps per frame as the speed allows
+        self.animator = FrameAnimator(self.canvas, self.next_step, self.has_more_steps,
+                                      on_frame=self.show_animation_rate, on_finish=self.finish_animation)
+
+        # Every computation step, then every traceback step; dragging jumps straight to a step
+        self.timeline = Scale(self.left_frame, orient="horizontal", from_=0, to=0, showvalue=0,
+                              command=self.on_timeline)
+        self.timeline.pack(side="bottom", fill="x")
+
         # Right side panel for controls
         right_frame = Frame(self)
         right_frame.pack(side="right", fill="y")
@@ -85,10 +109,22 @@ class PageOne(tk.Frame):
         self.mismatch_var = IntVar(value=-1)
         mismatch_entry = Entry(right_frame, textvariable=self.mismatch_var, width=5)
 
-        gap_label = Label(right_frame, text="Gap Penalty")
+        gap_label = Label(right_frame, text="Gap Open")
         self.gap_var = IntVar(value=-1)
         gap_entry = Entry(right_frame, textvariable=self.gap_var, width=5)
 
+        # Affine gaps: a gap of length L costs open + (L - 1) * extend
+        gap_extend_label = Label(right_frame, text="Gap Extend")
+        self.gap_extend_var = IntVar(value=-1)
+        gap_extend_entry = Entry(right_frame, textvariable=self.gap_extend_var, width=5)
+
+        # A substitution matrix replaces match/mismatch only until they are edited, and
+        # the explanation follows every edit of the scoring fields
+        self.match_var.trace_add("write", self.on_match_edited)
+        self.mismatch_var.trace_add("write", self.on_match_edited)
+        self.gap_var.trace_add("write", lambda *args: self.update_explanation())
+        self.gap_extend_var.trace_add("write", lambda *args: self.update_explanation())
+
         # Position input UI elements
         label1.grid(row=3, column=0, sticky="w", pady=5)
         entry1.grid(row=3, column=1, columnspan=3, sticky="we", pady=5)
@@ -108,6 +144,9 @@ class PageOne(tk.Frame):
         gap_label.grid(row=10, column=0, sticky="w", pady=2)
         gap_entry.grid(row=10, column=1, sticky="w", pady=2)
 
+        gap_extend_label.grid(row=10, column=2, sticky="w", pady=2)
+        gap_extend_entry.grid(row=10, column=3, sticky="w", pady=2)
+
         # Add a scoring examples section
         examples_label = Label(right_frame, text="Example scoring schemes:", font=("Helvetica", 9))
         examples_label.grid(row=11, column=0, columnspan=2, sticky="w", pady=(10, 0))
@@ -117,7 +156,7 @@ class PageOne(tk.Frame):
         dna_button.grid(row=12, column=0, sticky="w", pady=2)
 
         protein_button = Button(right_frame, text="BLOSUM62", width=8,
-                              command=lambda: self.set_scoring_scheme(1, -1, -1))
+                              command=lambda: self.set_scoring_scheme(1, -1, -11, -1, "BLOSUM62"))
         protein_button.grid(row=12, column=1, sticky="w", pady=2)
 
         custom_button = Button(right_frame, text="Custom", width=8,
@@ -162,6 +201,13 @@ class PageOne(tk.Frame):
         self.end_button = Button(right_frame, text=">>", width=3, command=self.animate_to_end, state="disabled")
         self.end_button.grid(row=17, column=3, pady=5)
 
+        # Zoom: below the readable cell size the matrix turns into a heatmap
+        zoom_out_button = Button(right_frame, text="-", width=3, command=self.view.zoom_out)
+        zoom_out_button.grid(row=17, column=0, pady=5)
+
+        zoom_in_button = Button(right_frame, text="+", width=3, command=self.view.zoom_in)
+        zoom_in_button.grid(row=17, column=1, pady=5)
+
         # Animation speed control
         speed_label = Label(right_frame, text="Animation Speed:", font=("Helvetica", 9))
         speed_label.grid(row=18, column=0, sticky="w")
@@ -190,32 +236,49 @@ class PageOne(tk.Frame):
         self.match_entry = match_entry
         self.mismatch_entry = mismatch_entry
         self.gap_entry = gap_entry
+        self.gap_extend_entry = gap_extend_entry
 
     def set_animation_speed(self, speed):
         """Set the animation speed (1=fast, 2=medium, 3=slow)"""
         self.speed_var.set(speed)
 
-    def set_scoring_scheme(self, match, mismatch, gap):
-        """Set a predefined scoring scheme"""
+        # A running animation picks up the new speed straight away
+        if self.animation_in_progress:
+            self.animator.start(self.get_animation_rate())
+
+    def set_scoring_scheme(self, match, mismatch, gap, gap_extend=None, substitution=None):
+        """Set a predefined scoring scheme, optionally backed by a substitution matrix"""
         self.match_var.set(match)
         self.mismatch_var.set(mismatch)
         self.gap_var.set(gap)
+        self.gap_extend_var.set(gap if gap_extend is None else gap_extend)
+        # Set last, as writing match/mismatch clears it
+        self.substitution = substitution
+        self.update_explanation()
+
+    def on_match_edited(self, *args):
+        """Editing match/mismatch by hand drops the substitution matrix they stand in for"""
+        self.substitution = None
         self.update_explanation()
 
     def reset_form(self):
         """Reset the form to default values"""
-        # Stop any ongoing animation
-        if self.animation_in_progress:
-            self.animation_in_progress = False
-            self.canvas.after_cancel(self.animation_id)
+        # Stop any ongoing animation and computation
+        self.animation_in_progress = False
+        self.animator.stop()
+        self.cancel_computation()
 
         self.entry1_var.set("")
         self.entry2_var.set("")
         self.match_var.set(1)
         self.mismatch_var.set(-1)
         self.gap_var.set(-1)
+        self.gap_extend_var.set(-1)
+        self.substitution = None
         self.update_explanation()
-        self.canvas.delete("all")
+        self.view.clear()
+        self.timeline.config(to=0)
+        self.timeline.set(0)
         self.result_label.config(text="")
         self.progress_label.config(text="")
         self.prev_button.config(state="disabled")
@@ -225,19 +288,34 @@ class PageOne(tk.Frame):
 
     def update_explanation(self):
         """Update the explanation text based on current scoring parameters"""
-        text = f"Current scoring matrix: Match = +{self.match_var.get()}, "
-        text += f"Mismatch = {self.mismatch_var.get()}, Gap = {self.gap_var.get()}"
+        # Runs on every keystroke, so a field may be empty or hold a lone "-"
+        try:
+            match, mismatch = self.match_var.get(), self.mismatch_var.get()
+            gap, gap_extend = self.gap_var.get(), self.gap_extend_var.get()
+        except tk.TclError:
+            return
+
+        if self.substitution:
+            text = f"Current scoring matrix: {self.substitution}, "
+        else:
+            text = f"Current scoring matrix: Match = +{match}, "
+            text += f"Mismatch = {mismatch}, "
+        if gap == gap_extend:
+            text += f"Gap = {gap}"
+        else:
+            text += f"Gap open = {gap}, Gap extend = {gap_extend}"
         self.explanation.config(text=text)
 
     def initialize(self):
         """Initialize the algorithm with the input values"""
-        # Stop any ongoing animation
-        if hasattr(self, 'animation_id') and self.animation_in_progress:
-            self.animation_in_progress = False
-            self.canvas.after_cancel(self.animation_id)
+        # Stop any ongoing animation and computation
+        self.animation_in_progress = False
+        self.animator.stop()
+        self.cancel_computation()
 
         # Clear canvas
-        self.canvas.delete("all")
+        self.view.clear()
+        self.timeline.config(to=0)
 
         # Get input values
         self.seq1 = self.entry1_var.get().upper()
@@ -251,6 +329,10 @@ class PageOne(tk.Frame):
         self.match_award = self.match_var.get()
         self.mismatch_penalty = self.mismatch_var.get()
         self.gap_penalty = self.gap_var.get()
+        self.gap_extend = self.gap_extend_var.get()
+
+        # Equal open and extend costs are a linear gap model
+        self.affine = self.gap_penalty != self.gap_extend
 
         self.n = len(self.seq1)
         self.m = len(self.seq2)
@@ -259,135 +341,99 @@ class PageOne(tk.Frame):
         self.current_step_index = 0
         self.traceback_started = False
         self.highlighted_path = []
+        self.computation_steps = []
+        self.traceback_path = []
         self.animation_completed_matrix = False
 
-        # Enable/disable navigation buttons
+        # Navigation waits for the computation
         self.prev_button.config(state="disabled")
-        self.next_button.config(state="normal")
+        self.next_button.config(state="disabled")
         self.start_button.config(state="disabled")
-        self.end_button.config(state="normal")
+        self.end_button.config(state="disabled")
 
-        # Compute the matrix and get steps
-        self.score, self.computation_steps = compute_needleman_wunsch(
-            self.seq1, self.seq2, self.match_award, self.mismatch_penalty, self.gap_penalty
+        self.progress_label.config(text="Computing the matrix...")
+        self.result_label.config(text="")
+
+        # The window stays responsive while a worker thread computes
+        # The worker gets a snapshot of the inputs, as the next initialize replaces
+        # them while a cancelled job may still be running
+        inputs = (self.seq1, self.seq2, self.match_award, self.mismatch_penalty, self.gap_penalty,
+                  self.gap_extend, self.substitution)
+        self.job = BackgroundJob(self.canvas, self.compute, inputs, on_progress=self.show_computation_progress,
+                                 on_done=self.show_computation, on_error=self.show_computation_error)
+        self.job.start()
+
+    def cancel_computation(self):
+        """Stop the background computation, if one is running"""
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+
+    def compute(self, job, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution):
+        """
+        Compute the matrix, its steps and the traceback on the worker thread
+        Only uses the inputs it is given and touches no widget
+        """
+        # Unchanged inputs come from the cache
+        score, steps = shared_cache().needleman_wunsch(
+            seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend,
+            substitution=substitution, progress=job.progress
         )
+        job.check()
+        traceback = self.find_traceback(score, steps, seq1, seq2, match_award, mismatch_penalty, gap_penalty,
+                                        gap_extend, substitution)
+        return score, steps, traceback
+
+    def show_computation_progress(self, done, total):
+        """Show how much of the matrix the worker has filled"""
+        self.progress_label.config(text=f"Computing the matrix... {100 * done // max(total, 1)}%")
+
+    def show_computation(self, result):
+        """Show the computed matrix, ready to step through"""
+        self.job = None
+        self.score, self.computation_steps, (self.align1, self.align2, self.traceback_path) = result
 
         # Create the matrix visualization
         self.create_matrix_visualization()
+        self.timeline.config(to=self.timeline_length())
+        self.timeline.set(0)
 
+        self.next_button.config(state="normal")
+        self.end_button.config(state="normal")
         self.progress_label.config(text=f"Matrix initialized. Ready to start computation.")
-        self.result_label.config(text="")
+
+    def show_computation_error(self, error):
+        """Report a computation that failed"""
+        self.job = None
+        self.progress_label.config(text="")
+        self.result_label.config(text=f"Computation failed: {error}")
 
     def create_matrix_visualization(self):
         """Create the initial visualization of the matrix"""
-        self.canvas.delete("all")
-
-        # Calculate canvas size with extra space for shifted letters
-        width = (self.n + 2) * self.cell_size + 1  # Extra space for the shift
-        height = (self.m + 2) * self.cell_size
-
-        self.canvas.config(scrollregion=(0, 0, width, height))
-
-        # Draw sequence labels - shifted 100 pixels to the right
-        for i in range(self.n):
-            # Center the sequence 1 letters in the middle of their cells, shifted 100px right
-            self.canvas.create_text(
-                (i+2) * self.cell_size - self.cell_size/2 + 30, self.cell_size/2,
-                text=self.seq1[i], font=("Helvetica", 10, "bold")
-            )
-
-        for i in range(self.m):
-            # Center the sequence 2 letters in the middle of their cells, shifted 100px right
-            self.canvas.create_text(
-                self.cell_size/2, (i+2) * self.cell_size - self.cell_size/2 + 30,
-                text=self.seq2[i], font=("Helvetica", 10, "bold")
-            )
-
-        # Draw the matrix cells - keeping the matrix in the same position
-        for i in range(self.m+1):
-            for j in range(self.n+1):
-                x = (j+1) * self.cell_size
-                y = (i+1) * self.cell_size
-
-                # Draw cell background
-                self.canvas.create_rectangle(
-                    x, y, x + self.cell_size, y + self.cell_size,
-                    fill="white", outline="black", tags=f"cell_{i}_{j}"
-                )
-
-                if i == 0 or j == 0:
-                    value = 0
-                    if i == 0 and j > 0:
-                        value = self.gap_penalty * j
-                    elif j == 0 and i > 0:
-                        value = self.gap_penalty * i
-
-                    # Draw the value
-                    self.canvas.create_text(
-                        x + self.cell_size/2, y + self.cell_size/2,
-                        text=str(value), tags=f"text_{i}_{j}"
-                    )
-
-    def highlight_cell(self, i, j, color="#D6EAF8"):  # Light blue highlight
-        """Highlight a specific cell in the matrix"""
-        # Calculate cell position
-        x = (j+1) * self.cell_size
-        y = (i+1) * self.cell_size
-
-        # Create or update the highlight rectangle
-        tag = f"highlight_{i}_{j}"
-        self.canvas.delete(tag)
-
-        self.canvas.create_rectangle(
-            x, y, x + self.cell_size, y + self.cell_size,
-            fill=color, outline="black", tags=[tag, "highlight"]
-        )
-
-        # Make sure the text is on top
-        self.canvas.tag_raise(f"text_{i}_{j}")
-
-    def update_cell_value(self, i, j, value):
-        """Update the value displayed in a cell"""
-        # Calculate cell position
-        x = (j+1) * self.cell_size
-        y = (i+1) * self.cell_size
+        self.view.reset(self.seq1, self.seq2, self.score)
 
-        # Delete old text
-        self.canvas.delete(f"text_{i}_{j}")
-
-        # Create new text
-        self.canvas.create_text(
-            x + self.cell_size/2, y + self.cell_size/2,
-            text=str(value), tags=f"text_{i}_{j}"
-        )
+    def highlight_cell(self, i, j, color=COMPUTED_COLOR):  # Light blue highlight
+        """Highlight a specific cell in the matrix"""
+        self.view.highlight(i, j, color)
 
     def next_step(self):
         """Process the next step in the algorithm"""
         if self.traceback_started:
             # We're in traceback mode
             self.show_more_traceback()
-            return
 
-        if self.current_step_index < len(self.computation_steps):
+        elif self.current_step_index < len(self.computation_steps):
             # Show next computation step
             step = self.computation_steps[self.current_step_index]
             i, j = step['i'], step['j']
 
-            # Update the value and highlight the current cell
-            self.update_cell_value(i, j, step['score'])
+            # Reveal the value and highlight the current cell
+            self.view.reveal(i, j)
             self.highlight_cell(i, j)
 
-            # Update progress
-            self.progress_label.config(text=f"Step {self.current_step_index+1}/{len(self.computation_steps)}: "
-                                         f"Computing cell ({i}, {j})")
-
             # Increment step counter
             self.current_step_index += 1
 
-            # Enable previous button
-            self.prev_button.config(state="normal")
-            self.start_button.config(state="normal")
-
             # Check if we've completed the matrix
             if self.current_step_index >= len(self.computation_steps):
                 self.animation_completed_matrix = True
@@ -401,68 +447,106 @@ class PageOne(tk.Frame):
             if not self.traceback_started:
                 self.start_traceback()
 
-    def previous_step(self):
-        """Go back one step in the algorithm"""
-        if self.traceback_started:
-            # We're in traceback mode
-            if len(self.highlighted_path) > 0:
-                # Remove last highlighted cell from path
-                i, j = self.highlighted_path.pop()
-
-                # Remove highlight
-                self.canvas.delete(f"highlight_{i}_{j}")
-
-                # Update progress
-                self.progress_label.config(text=f"Traceback: {len(self.highlighted_path)}/{len(self.traceback_path)} cells")
-
-                # If we've removed all traceback cells, go back to matrix computation
-                if len(self.highlighted_path) == 0:
-                    self.traceback_started = False
-                    self.next_button.config(state="normal")
-                    self.end_button.config(state="normal")
-                    self.result_label.config(text="")
-
-                return
+        # While animating, the progress, buttons and timeline follow once per frame instead
+        if not self.animation_in_progress:
+            self.show_step_state()
 
-            # No more traceback to undo, so revert to matrix computation
-            self.traceback_started = False
-            self.canvas.delete("highlight")
-            self.highlight_cell(self.m, self.n)  # Highlight bottom right cell
-            self.next_button.config(state="normal")
-            self.end_button.config(state="normal")
+    def previous_step(self):
+        """Go back one step in the algorithm, hiding the cell values it revealed"""
+        self.seek(self.timeline_position() - 1)
+
+    def timeline_length(self):
+        """Number of steps: every matrix cell, then every traceback cell"""
+        return len(self.computation_steps) + len(self.traceback_path)
+
+    def timeline_position(self):
+        """Number of steps shown so far"""
+        return self.current_step_index + len(self.highlighted_path)
+
+    def on_timeline(self, value):
+        """Jump to the step the timeline was dragged to"""
+        if int(float(value)) != self.timeline_position():
+            self.seek(int(float(value)))
+
+    def update_timeline(self):
+        """Move the timeline to the step shown"""
+        self.timeline.set(self.timeline_position())
+
+    def seek(self, position):
+        """
+        Show the state after the given number of steps
+        Only the cells that differ from the state shown are touched: traceback
+        cells are taken back or added one at a time and matrix cells are revealed
+        or hidden a row-major block at a time
+        """
+        self.animation_in_progress = False
+        self.animator.stop()
+        if self.view.score is None:
             return
 
-        # Not in traceback mode, so go back a computation step
-        if self.current_step_index > 0:
-            self.current_step_index -= 1
-
-            # Clear highlights
-            self.canvas.delete("highlight")
+        total = len(self.computation_steps)
+        position = min(max(position, 0), self.timeline_length())
+        path_cells = max(position - total, 0)
+        index = min(position, total)
 
-            if self.current_step_index > 0:
-                # Show previous step
-                step = self.computation_steps[self.current_step_index-1]
-                i, j = step['i'], step['j']
-
-                # Highlight the cell
-                self.highlight_cell(i, j)
+        # Take back the traceback cells past the position
+        while len(self.highlighted_path) > path_cells:
+            self.highlighted_path.pop()
+            self.view.remove_path_step()
+        if path_cells == 0 and self.traceback_started:
+            self.traceback_started = False
+            self.result_label.config(text="")
+
+        # Reveal or hide the matrix cells between the shown and the requested step
+        if index > self.current_step_index:
+            self.view.fill_range(self.current_step_index, index, True, COMPUTED_COLOR)
+        elif index < self.current_step_index:
+            self.view.fill_range(index, self.current_step_index, False)
+        self.current_step_index = index
+        self.animation_completed_matrix = index >= total
+
+        # Add the traceback cells up to the position
+        if path_cells and not self.traceback_started:
+            self.start_traceback()
+        while len(self.highlighted_path) < path_cells:
+            self.show_more_traceback()
 
-                # Update progress
-                self.progress_label.config(text=f"Step {self.current_step_index}/{len(self.computation_steps)}: "
-                                         f"Showing cell ({i}, {j})")
-            else:
-                # At the beginning
-                self.progress_label.config(text="Matrix initialized. Ready to start computation.")
-                self.prev_button.config(state="disabled")
-                self.start_button.config(state="disabled")
+        # Progress and buttons as stepping there would have left them
+        self.show_step_state()
 
-    def start_traceback(self):
-        """Start the traceback process to find optimal alignment"""
-        # Get the alignment and traceback path
-        self.align1, self.align2, self.traceback_path = get_traceback_needleman_wunsch(
-            self.seq1, self.seq2, self.score
+    def show_step_state(self, note=""):
+        """Set the progress text (followed by note), buttons and timeline for the step shown"""
+        index = self.current_step_index
+        if self.traceback_started:
+            text = f"Traceback: {len(self.highlighted_path)}/{len(self.traceback_path)} cells"
+        elif index > 0:
+            step = self.computation_steps[index - 1]
+            text = f"Step {index}/{len(self.computation_steps)}: Computing cell ({step['i']}, {step['j']})"
+        else:
+            text = "Matrix initialized. Ready to start computation."
+        self.progress_label.config(text=text + note)
+
+        position = self.timeline_position()
+        back = "normal" if position > 0 else "disabled"
+        forward = "normal" if position < self.timeline_length() else "disabled"
+        self.prev_button.config(state=back)
+        self.start_button.config(state=back)
+        self.next_button.config(state=forward)
+        self.end_button.config(state=forward)
+        self.update_timeline()
+
+    def find_traceback(self, score, steps, seq1, seq2, match_award, mismatch_penalty, gap_penalty, gap_extend,
+                       substitution):
+        """Return the optimal alignment and its traceback path"""
+        if gap_penalty != gap_extend:
+            return get_traceback_needleman_wunsch_affine(seq1, seq2, steps.directions)
+        return get_traceback_needleman_wunsch(
+            seq1, seq2, score, match_award, mismatch_penalty, gap_penalty,
+            directions=steps.directions, substitution=substitution
         )
 
+    def start_traceback(self):
+        """Start the traceback process along the optimal alignment"""
         # Display alignment
         self.result_label.config(text=f"{self.align1}\n{self.align2}")
 
@@ -496,70 +580,27 @@ class PageOne(tk.Frame):
             self.highlighted_path.append((i, j))
 
             # Highlight this cell - green for optimal path
-            self.highlight_cell(i, j, "#ABEBC6")  # Light green
-
-            # Update progress
-            self.progress_label.config(text=f"Traceback: {len(self.highlighted_path)}/{len(self.traceback_path)} cells")
-
-            # Disable next/end buttons when we're done
-            if len(self.highlighted_path) == len(self.traceback_path):
-                self.next_button.config(state="disabled")
-                self.end_button.config(state="disabled")
+            self.view.add_path_step(i, j, "#ABEBC6")  # Light green
 
     def go_to_start(self):
         """Go back to the beginning of the algorithm"""
-        # Stop any ongoing animation
-        if self.animation_in_progress:
-            self.animation_in_progress = False
-            self.canvas.after_cancel(self.animation_id)
-
-        # Clear any highlights
-        self.canvas.delete("highlight")
-
-        # Reset state
-        self.current_step_index = 0
-        self.traceback_started = False
-        self.highlighted_path = []
-        self.animation_completed_matrix = False
-
-        # Redraw the matrix
-        self.create_matrix_visualization()
-
-        # Update UI
-        self.progress_label.config(text="Matrix initialized. Ready to start computation.")
-        self.result_label.config(text="")
-
-        # Update button states
-        self.prev_button.config(state="disabled")
-        self.next_button.config(state="normal")
-        self.start_button.config(state="disabled")
-        self.end_button.config(state="normal")
+        self.seek(0)
 
     def animate_to_end(self):
-        """Animate all steps one by one until the end"""
+        """Animate the remaining steps, batching as many per frame as the speed allows"""
         # Start animation if not already in progress
-        if not hasattr(self, 'animation_in_progress') or not self.animation_in_progress:
+        if not self.animation_in_progress and self.has_more_steps():
             self.animation_in_progress = True
-            self.animate_next_step()
+            self.animator.start(self.get_animation_rate())
 
-    def animate_next_step(self):
-        """Animate a single step and schedule the next one"""
-        if not self.animation_in_progress:
-            return
-
-        # Determine if we have more steps
-        has_more_steps = self.has_more_steps()
-
-        if has_more_steps:
-            # Perform the next step
-            self.next_step()
+    def show_animation_rate(self, cells_per_second):
+        """Once per animation frame: show the step reached and the measured animation rate"""
+        self.show_step_state(f"  ({cells_per_second:,.0f} cells/s)")
 
-            # Schedule the next animation step
-            delay = self.get_animation_delay()
-            self.animation_id = self.canvas.after(delay, self.animate_next_step)
-        else:
-            # Animation complete
-            self.animation_in_progress = False
+    def finish_animation(self):
+        """Called by the animator once every step has been shown"""
+        self.animation_in_progress = False
+        self.update_timeline()
 
     def has_more_steps(self):
         """Check if there are more steps to animate"""
@@ -573,12 +614,12 @@ class PageOne(tk.Frame):
             # Check if we still have matrix computation steps
             return self.current_step_index < len(self.computation_steps)
 
-    def get_animation_delay(self):
-        """Get the delay between animation steps based on speed setting"""
+    def get_animation_rate(self):
+        """Get the steps per second of the speed setting; None runs as fast as frames allow"""
         speed = self.speed_var.get()
         if speed == 1:  # Fast
-            return 100
+            return None
         elif speed == 2:  # Medium
-            return 300
+            return 50
         else:  # Slow
-            return 600
+            return 2
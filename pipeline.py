@@ -0,0 +1,201 @@
+"""
+Streaming batch alignment: parse -> pair -> align -> format -> write
+Every stage is a generator over batches of records, and at most max_pending
+batches are in flight at a time, so memory stays bounded whatever the input
+size and a slow aligner simply stops the parser from reading ahead
+"""
+
+import json
+import os
+from collections import deque, namedtuple
+from multiprocessing import Pool
+
+from alignment_cache import ResultCache, cache_key
+from improved_algorithm import (compute_hirschberg, compute_needleman_wunsch_affine, compute_smith_waterman_affine,
+                                compute_smith_waterman_hirschberg, get_traceback_affine_operations,
+                                operations_to_cigar, score_operations)
+
+# One aligned pair; start and end are (query, target) positions, 0-based and half-open
+AlignmentRecord = namedtuple("AlignmentRecord", ["query", "target", "score", "start", "end", "cigar"])
+
+# Scoring of a pool worker, set once by the pool initializer
+_worker_state = {}
+
+
+def batched(items, size):
+    """Groups an iterable into lists of at most size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def zip_pairs(queries, targets):
+    """
+    Pairs the k-th query record with the k-th target record
+    Yields (query name, query, target name, target)
+    """
+    for (query_name, query), (target_name, target) in zip(queries, targets):
+        yield query_name, query, target_name, target
+
+
+def reference_pairs(queries, reference_name, reference):
+    """
+    Pairs every query record with one reference sequence
+    Within a batch the reference object is pickled once, not once per pair
+    """
+    for query_name, query in queries:
+        yield query_name, query, reference_name, reference
+
+
+def _operations_from_alignment(align1, align2):
+    """Recovers the 'M'/'D'/'I' operations of two alignment strings"""
+    return ['D' if b == '-' else 'I' if a == '-' else 'M' for a, b in zip(align1, align2)]
+
+
+def align_pair(query_name, query, target_name, target, mode, match_award, mismatch_penalty, gap_penalty,
+               substitution=None, gap_extend=None, cache=None):
+    """
+    Aligns one query against one target
+    The target is seq1, the reference of operations_to_cigar, so 'D' is a base of
+    the target missing from the query and 'I' one the query adds, as in SAM
+    Linear gaps run in linear space (Hirschberg); when gap_extend differs from
+    gap_penalty, gap_penalty opens a gap and the full affine matrices are used
+    With a ResultCache, a pair aligned before is looked up instead of realigned
+    """
+    if cache is not None:
+        key = cache_key(mode, target, query, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution)
+        cached = cache.get(key)
+        if cached is not None:
+            score, start, end, cigar = cached
+            return AlignmentRecord(query_name, target_name, score, tuple(start), tuple(end), cigar)
+
+    affine = gap_extend is not None and gap_extend != gap_penalty
+    if mode == "nw":
+        if affine:
+            matrix, steps = compute_needleman_wunsch_affine(target, query, match_award, mismatch_penalty,
+                                                            gap_penalty, gap_extend, substitution=substitution)
+            operations, _ = get_traceback_affine_operations(steps.directions, (len(query), len(target)))
+            score = matrix[-1, -1]
+        else:
+            align1, align2, _ = compute_hirschberg(target, query, match_award, mismatch_penalty, gap_penalty,
+                                                   substitution=substitution)
+            operations = _operations_from_alignment(align1, align2)
+            score = score_operations(target, query, operations, match_award, mismatch_penalty, gap_penalty,
+                                     substitution=substitution)
+        start, end = (0, 0), (len(query), len(target))
+    elif mode == "sw":
+        if affine:
+            matrix, steps, end = compute_smith_waterman_affine(target, query, match_award, mismatch_penalty,
+                                                               gap_penalty, gap_extend, substitution=substitution)
+            operations, start = get_traceback_affine_operations(steps.directions, end, local=True)
+            score = matrix[end]
+        else:
+            hit = compute_smith_waterman_hirschberg(target, query, match_award, mismatch_penalty, gap_penalty,
+                                                    substitution=substitution)
+            operations = _operations_from_alignment(hit.align1, hit.align2)
+            score, start, end = hit.score, hit.start, hit.end
+    else:
+        raise ValueError(f"Unknown alignment mode {mode}")
+
+    # Matrix cells are (query, target) positions, rows running over the query
+    record = AlignmentRecord(query_name, target_name, int(score), tuple(int(k) for k in start),
+                             tuple(int(k) for k in end), operations_to_cigar(operations))
+    if cache is not None:
+        cache.put(key, record[2:])
+    return record
+
+
+def _init_worker(mode, scoring, cache_dir=None):
+    """Pool initializer: sets the mode, scoring and result cache of a worker once"""
+    _worker_state["mode"] = mode
+    _worker_state["scoring"] = scoring
+    _worker_state["cache"] = ResultCache("record", cache_dir) if cache_dir else None
+
+
+def _align_batch(batch):
+    """Aligns a batch of (query name, query, target name, target) pairs in a worker"""
+    mode = _worker_state["mode"]
+    scoring = _worker_state["scoring"]
+    cache = _worker_state["cache"]
+    return [align_pair(*pair, mode, *scoring, cache=cache) for pair in batch]
+
+
+def align_stream(pairs, mode="nw", match_award=1, mismatch_penalty=-1, gap_penalty=-1, substitution=None,
+                 processes=1, batch_size=64, max_pending=None, gap_extend=None, cache_dir=None):
+    """
+    Aligns a stream of (query name, query, target name, target) pairs
+    A gap_extend different from gap_penalty selects affine gaps (see align_pair)
+    With a cache_dir, records are cached there as JSON files by the hash of the
+    pair and scoring, so a later run skips the pairs it has aligned before
+    Pairs are cut into batches and at most max_pending batches (default two per
+    process) are queued at a time; the next batch is only pulled from the input
+    once the oldest result has been handed on
+    Yields an AlignmentRecord per pair, in input order
+    """
+    if mode not in ("nw", "sw"):
+        raise ValueError(f"Unknown alignment mode {mode}")
+    scoring = (match_award, mismatch_penalty, gap_penalty, substitution, gap_extend)
+    batches = batched(pairs, batch_size)
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(mode, scoring, cache_dir)
+        for batch in batches:
+            yield from _align_batch(batch)
+        return
+
+    max_pending = max_pending or 2 * processes
+    with Pool(processes, initializer=_init_worker, initargs=(mode, scoring, cache_dir)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_align_batch, (batch,)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+# Column order of the tab-separated output
+TSV_FIELDS = ["query", "target", "score", "query_start", "query_end", "target_start", "target_end", "cigar"]
+
+
+def format_tsv(record):
+    """Formats an AlignmentRecord as one tab-separated line"""
+    fields = (record.query, record.target, record.score, record.start[0], record.end[0],
+              record.start[1], record.end[1], record.cigar)
+    return "\t".join(str(field) for field in fields)
+
+
+def format_jsonl(record):
+    """Formats an AlignmentRecord as one JSON line"""
+    return json.dumps({
+        "query": record.query,
+        "target": record.target,
+        "score": record.score,
+        "query_start": record.start[0],
+        "query_end": record.end[0],
+        "target_start": record.start[1],
+        "target_end": record.end[1],
+        "cigar": record.cigar,
+    })
+
+
+def format_cigar(record):
+    """Formats an AlignmentRecord as query, target and CIGAR only"""
+    return f"{record.query}\t{record.target}\t{record.cigar}"
+
+
+def write_lines(lines, handle, header=None):
+    """Writes formatted lines as they arrive; returns the number written"""
+    count = 0
+    if header is not None:
+        handle.write(header + "\n")
+    for line in lines:
+        handle.write(line + "\n")
+        count += 1
+    return count
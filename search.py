@@ -0,0 +1,192 @@
+"""
+Database search: one query aligned against many targets
+Targets are scored in chunks on a process pool, and a bounded heap keeps the
+top-N hits so targets that provably cannot enter it are never aligned
+Workers read the sequences from a shared-memory store, so a task is a list of
+(query index, target index) pairs
+"""
+
+import heapq
+import os
+from collections import deque, namedtuple
+from multiprocessing import Pool
+
+from alignment_cache import ResultCache, cache_key
+from improved_algorithm import (compute_needleman_wunsch_affine, compute_needleman_wunsch_score,
+                                compute_smith_waterman_affine, compute_smith_waterman_score)
+from sequence_store import SequenceStore
+from substitution_matrices import get_matrix
+
+# end is (target_end, query_end) of a local hit, None for global alignments
+SearchHit = namedtuple("SearchHit", ["score", "index", "name", "end"])
+
+# Sequences and scoring of a pool worker, set once by the pool initializer
+_worker_state = {}
+
+
+def best_pair_score(match_award, mismatch_penalty, substitution=None):
+    """
+    Returns the best score a single aligned pair of residues can get
+    """
+    if substitution is not None:
+        if isinstance(substitution, str):
+            substitution = get_matrix(substitution)
+        return substitution.max_score
+    return max(match_award, mismatch_penalty)
+
+
+def score_upper_bound(mode, query_length, target_length, best_pair, gap_penalty):
+    """
+    Upper bound on the alignment score computed from the sequence lengths alone
+    """
+    if mode == "sw":
+        return max(0, best_pair) * min(query_length, target_length)
+
+    # A global alignment has at least |m - n| gaps; with g gaps it aligns at most
+    # (m + n - g) / 2 pairs, and that bound is linear in g
+    total = query_length + target_length
+    least_gaps = abs(query_length - target_length)
+    return max((best_pair * (total - g) + 2 * gap_penalty * g) // 2 for g in (least_gaps, total))
+
+
+def align_score(query, target, mode, match_award, mismatch_penalty, gap_penalty, substitution=None,
+                gap_extend=None, cache=None):
+    """
+    Scores one query/target pair, in linear memory for linear gaps
+    A gap_extend different from gap_penalty makes gap_penalty the gap opening
+    and scores with the full affine matrices
+    With a ResultCache, a pair scored before is looked up instead of realigned
+    Returns the score and, for local alignments, the (target_end, query_end) cell
+    """
+    if cache is not None:
+        key = cache_key(mode, query, target, match_award, mismatch_penalty, gap_penalty, gap_extend, substitution)
+        cached = cache.get(key)
+        if cached is not None:
+            score, end = cached
+            return score, (tuple(end) if end is not None else None)
+        score, end = align_score(query, target, mode, match_award, mismatch_penalty, gap_penalty, substitution,
+                                 gap_extend)
+        end = tuple(int(k) for k in end) if end is not None else None
+        cache.put(key, (int(score), end))
+        return score, end
+
+    if gap_extend is not None and gap_extend != gap_penalty:
+        if mode == "sw":
+            score, _, max_pos = compute_smith_waterman_affine(query, target, match_award, mismatch_penalty,
+                                                              gap_penalty, gap_extend, substitution=substitution)
+            return int(score[max_pos]), max_pos
+        score, _ = compute_needleman_wunsch_affine(query, target, match_award, mismatch_penalty, gap_penalty,
+                                                   gap_extend, substitution=substitution)
+        return int(score[-1, -1]), None
+
+    if mode == "sw":
+        return compute_smith_waterman_score(query, target, match_award, mismatch_penalty, gap_penalty,
+                                            substitution=substitution)
+    score = compute_needleman_wunsch_score(query, target, match_award, mismatch_penalty, gap_penalty,
+                                           substitution=substitution)
+    return score, None
+
+
+def _init_worker(handle, mode, scoring, cache_dir=None):
+    """Pool initializer: attaches a worker to the sequence store and sets the scoring and cache once"""
+    _worker_state["store"] = SequenceStore.attach(handle)
+    _worker_state["mode"] = mode
+    _worker_state["scoring"] = scoring
+    _worker_state["cache"] = ResultCache("score", cache_dir) if cache_dir else None
+
+
+def _align_chunk(chunk):
+    """Scores a chunk of (query index, target index) pairs in a worker"""
+    store = _worker_state["store"]
+    mode = _worker_state["mode"]
+    scoring = _worker_state["scoring"]
+    cache = _worker_state["cache"]
+
+    results = []
+    for query_index, target_index in chunk:
+        score, end = align_score(store[query_index], store[target_index], mode, *scoring, cache=cache)
+        results.append((target_index, score, end))
+    return results
+
+
+def search_database(query, targets, mode="sw", match_award=1, mismatch_penalty=-1, gap_penalty=-1,
+                    substitution=None, top_n=10, processes=None, chunk_size=64, gap_extend=None, cache_dir=None):
+    """
+    Aligns one query against every (name, sequence) target and returns the top_n hits
+    A gap_extend different from gap_penalty selects affine gaps (see align_score)
+    With a cache_dir, pair scores are cached there as JSON files, so repeated
+    searches only align the targets they have not scored before
+    Targets are visited in decreasing order of their length-based score bound, so
+    once the bound of the next target cannot beat the current top_n, the search stops
+    Hits are sorted by decreasing score, ties broken by target order
+    """
+    if mode not in ("nw", "sw"):
+        raise ValueError(f"Unknown alignment mode {mode}")
+    if top_n <= 0:
+        return []
+
+    targets = list(targets)
+    scoring = (match_award, mismatch_penalty, gap_penalty, substitution, gap_extend)
+    best_pair = best_pair_score(match_award, mismatch_penalty, substitution)
+
+    # With affine gaps every gap position scores at most the larger of the two costs
+    gap_bound = gap_penalty if gap_extend is None else max(gap_penalty, gap_extend)
+    bounds = [score_upper_bound(mode, len(query), len(sequence), best_pair, gap_bound)
+              for _, sequence in targets]
+    order = sorted(range(len(targets)), key=lambda k: (-bounds[k], k))
+
+    # Min-heap of (score, -index, end); the root is the weakest kept hit
+    heap = []
+
+    def can_enter(k):
+        return len(heap) < top_n or (bounds[k], -k) > heap[0][:2]
+
+    def add_results(results):
+        for k, score, end in results:
+            if len(heap) < top_n:
+                heapq.heappush(heap, (score, -k, end))
+            elif (score, -k) > heap[0][:2]:
+                heapq.heapreplace(heap, (score, -k, end))
+
+    # Targets keep their indices in the store and the query comes last
+    query_index = len(targets)
+    sequences = [sequence for _, sequence in targets] + [query]
+
+    def next_chunk(position):
+        chunk = []
+        while position < len(order) and len(chunk) < chunk_size and can_enter(order[position]):
+            chunk.append((query_index, order[position]))
+            position += 1
+        return chunk, position
+
+    processes = processes or os.cpu_count() or 1
+    position = 0
+
+    if processes == 1:
+        _worker_state.update(store=sequences, mode=mode, scoring=scoring,
+                             cache=ResultCache("score", cache_dir) if cache_dir else None)
+        while True:
+            chunk, position = next_chunk(position)
+            if not chunk:
+                break
+            add_results(_align_chunk(chunk))
+    else:
+        with SequenceStore.create(sequences) as store, \
+                Pool(processes, initializer=_init_worker, initargs=(store.handle, mode, scoring, cache_dir)) as pool:
+            # Keep a couple of chunks per worker in flight; the bounds are checked
+            # against the heap as late as possible, right before submission
+            pending = deque()
+            while True:
+                while len(pending) < 2 * processes:
+                    chunk, position = next_chunk(position)
+                    if not chunk:
+                        break
+                    pending.append(pool.apply_async(_align_chunk, (chunk,)))
+                if not pending:
+                    break
+                add_results(pending.popleft().get())
+
+    hits = [SearchHit(score, -negative_index, targets[-negative_index][0], end)
+            for score, negative_index, end in heap]
+    hits.sort(key=lambda hit: (-hit.score, hit.index))
+    return hits
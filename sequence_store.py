@@ -0,0 +1,100 @@
+"""
+Shared-memory sequence store for parallel alignment workers
+A whole sequence set is packed into one shared buffer: an offsets header followed
+by the ascii codes of every sequence. Workers attach by name and slice sequences
+as NumPy views of the buffer, so tasks only need to carry sequence indices
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from substitution_matrices import sequence_codes
+
+
+class SequenceStore:
+    """
+    Sequences in one shared-memory block, indexed 0..len - 1
+    store[k] is a zero-copy uint8 view of sequence k that the alignment
+    kernels accept directly; views must be dropped before close()
+    """
+
+    def __init__(self, memory, count, names=None, owner=False):
+        self.memory = memory
+        self.count = count
+        self.names = names
+        self.owner = owner
+
+        header = (count + 1) * np.dtype(np.int64).itemsize
+        self.offsets = np.ndarray((count + 1,), dtype=np.int64, buffer=memory.buf)
+        self.codes = np.ndarray((int(self.offsets[-1]),), dtype=np.uint8, buffer=memory.buf, offset=header)
+
+    @classmethod
+    def create(cls, sequences):
+        """
+        Packs sequences into a new shared block
+        Items may be plain sequences or (name, sequence) pairs as read_fasta yields
+        """
+        names = []
+        packed = []
+        for item in sequences:
+            if isinstance(item, tuple):
+                name, sequence = item
+            else:
+                name, sequence = None, item
+            names.append(name)
+            packed.append(np.ascontiguousarray(sequence_codes(sequence), dtype=np.uint8))
+
+        offsets = np.zeros(len(packed) + 1, dtype=np.int64)
+        np.cumsum([len(sequence) for sequence in packed], out=offsets[1:])
+        header = offsets.nbytes
+
+        # A zero-size block is not allowed, the header always takes some room
+        memory = shared_memory.SharedMemory(create=True, size=header + int(offsets[-1]))
+        memory.buf[:header] = offsets.tobytes()
+        memory.buf[header:header + int(offsets[-1])] = b"".join(packed)
+
+        return cls(memory, len(packed), names, owner=True)
+
+    @classmethod
+    def attach(cls, handle):
+        """Attaches to a store from the handle of its creator"""
+        name, count = handle
+
+        # Pool workers share their parent's resource tracker, so attaching does not
+        # hand ownership of the block to the worker
+        return cls(shared_memory.SharedMemory(name=name), count)
+
+    @property
+    def handle(self):
+        """Picklable (block name, count) that attach() accepts"""
+        return self.memory.name, self.count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("sequence index out of range")
+        return self.codes[self.offsets[index]:self.offsets[index + 1]]
+
+    def text(self, index):
+        """Returns sequence index as a string"""
+        return self[index].tobytes().decode("ascii", "replace")
+
+    def close(self):
+        """Detaches from the block; the creator also frees it"""
+        self.offsets = None
+        self.codes = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,166 @@
+"""
+Substitution matrices for sequence alignment
+Each matrix is parsed once into a NumPy lookup table, and sequences are encoded
+to uint8 indices into that table
+"""
+
+import numpy as np
+
+
+def sequence_codes(seq):
+    """
+    Returns a sequence (str, bytes or array-like) as a NumPy array of byte codes
+    Bytes and uint8 arrays are viewed, not copied; every module that hashes,
+    packs, indexes or encodes sequences goes through this one conversion
+    """
+    if isinstance(seq, np.ndarray):
+        return seq
+    if isinstance(seq, str):
+        seq = seq.encode("ascii", "replace")
+    if isinstance(seq, (bytes, bytearray, memoryview)):
+        return np.frombuffer(seq, dtype=np.uint8)
+    # Array-likes such as FASTA regions hand over their codes themselves
+    return np.asarray(seq, dtype=np.uint8)
+
+
+BLOSUM62 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+
+PAM250 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  2 -2  0  0 -2  0  0  1 -1 -1 -2 -1 -1 -3  1  1  1 -6 -3  0  0  0  0 -8
+R -2  6  0 -1 -4  1 -1 -3  2 -2 -3  3  0 -4  0  0 -1  2 -4 -2 -1  0 -1 -8
+N  0  0  2  2 -4  1  1  0  2 -2 -3  1 -2 -3  0  1  0 -4 -2 -2  2  1  0 -8
+D  0 -1  2  4 -5  2  3  1  1 -2 -4  0 -3 -6 -1  0  0 -7 -4 -2  3  3 -1 -8
+C -2 -4 -4 -5 12 -5 -5 -3 -3 -2 -6 -5 -5 -4 -3  0 -2 -8  0 -2 -4 -5 -3 -8
+Q  0  1  1  2 -5  4  2 -1  3 -2 -2  1 -1 -5  0 -1 -1 -5 -4 -2  1  3 -1 -8
+E  0 -1  1  3 -5  2  4  0  1 -2 -3  0 -2 -5 -1  0  0 -7 -4 -2  3  3 -1 -8
+G  1 -3  0  1 -3 -1  0  5 -2 -3 -4 -2 -3 -5  0  1  0 -7 -5 -1  0  0 -1 -8
+H -1  2  2  1 -3  3  1 -2  6 -2 -2  0 -2 -2  0 -1 -1 -3  0 -2  1  2 -1 -8
+I -1 -2 -2 -2 -2 -2 -2 -3 -2  5  2 -2  2  1 -2 -1  0 -5 -1  4 -2 -2 -1 -8
+L -2 -3 -3 -4 -6 -2 -3 -4 -2  2  6 -3  4  2 -3 -3 -2 -2 -1  2 -3 -3 -1 -8
+K -1  3  1  0 -5  1  0 -2  0 -2 -3  5  0 -5 -1  0  0 -3 -4 -2  1  0 -1 -8
+M -1  0 -2 -3 -5 -1 -2 -3 -2  2  4  0  6  0 -2 -2 -1 -4 -2  2 -2 -2 -1 -8
+F -3 -4 -3 -6 -4 -5 -5 -5 -2  1  2 -5  0  9 -5 -3 -3  0  7 -1 -4 -5 -2 -8
+P  1  0  0 -1 -3  0 -1  0  0 -2 -3 -1 -2 -5  6  1  0 -6 -5 -1 -1  0 -1 -8
+S  1  0  1  0  0 -1  0  1 -1 -1 -3  0 -2 -3  1  2  1 -2 -3 -1  0  0  0 -8
+T  1 -1  0  0 -2 -1  0  0 -1  0 -2  0 -1 -3  0  1  3 -5 -3  0  0 -1  0 -8
+W -6  2 -4 -7 -8 -5 -7 -7 -3 -5 -2 -3 -4  0 -6 -2 -5 17  0 -6 -5 -6 -4 -8
+Y -3 -4 -2 -4  0 -4 -4 -5  0 -1 -1 -4 -2  7 -5 -3 -3  0 10 -2 -3 -4 -2 -8
+V  0 -2 -2 -2 -2 -2 -2 -1 -2  4  2 -2  2 -1 -1 -1  0 -6 -2  4 -2 -2 -1 -8
+B  0 -1  2  3 -4  1  3  0  1 -2 -3  1 -2 -4 -1  0  0 -5 -3 -2  3  2 -1 -8
+Z  0  0  1  3 -5  3  3  0  2 -2 -3  0 -2 -5  0  0 -1 -6 -4 -2  2  3 -1 -8
+X  0 -1  0 -1 -3 -1 -1 -1 -1 -1 -1 -1 -1 -2 -1  0  0 -4 -2 -1 -1 -1 -1 -8
+* -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8 -8  1
+"""
+
+EDNAFULL = """
+   A  T  G  C  S  W  R  Y  K  M  B  V  H  D  N  U
+A  5 -4 -4 -4 -4  1  1 -4 -4  1 -4 -1 -1 -1 -2 -4
+T -4  5 -4 -4 -4  1 -4  1  1 -4 -1 -4 -1 -1 -2  5
+G -4 -4  5 -4  1 -4  1 -4  1 -4 -1 -1 -4 -1 -2 -4
+C -4 -4 -4  5  1 -4 -4  1 -4  1 -1 -1 -1 -4 -2 -4
+S -4 -4  1  1 -1 -4 -2 -2 -2 -2 -1 -1 -3 -3 -1 -4
+W  1  1 -4 -4 -4 -1 -2 -2 -2 -2 -3 -3 -1 -1 -1  1
+R  1 -4  1 -4 -2 -2 -1 -4 -2 -2 -3 -1 -3 -1 -1 -4
+Y -4  1 -4  1 -2 -2 -4 -1 -2 -2 -1 -3 -1 -3 -1  1
+K -4  1  1 -4 -2 -2 -2 -2 -1 -4 -1 -3 -3 -1 -1  1
+M  1 -4 -4  1 -2 -2 -2 -2 -4 -1 -3 -1 -1 -3 -1 -4
+B -4 -1 -1 -1 -1 -3 -3 -1 -1 -3 -1 -2 -2 -2 -1 -1
+V -1 -4 -1 -1 -1 -3 -1 -3 -3 -1 -2 -1 -2 -2 -1 -4
+H -1 -1 -4 -1 -3 -1 -3 -1 -3 -1 -2 -2 -1 -2 -1 -1
+D -1 -1 -1 -4 -3 -1 -1 -3 -1 -3 -2 -2 -2 -1 -1 -1
+N -2 -2 -2 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2
+U -4  5 -4 -4 -4  1 -4  1  1 -4 -1 -4 -1 -1 -2  5
+"""
+
+# Matrix text and the symbol that stands in for characters outside its alphabet
+MATRIX_SOURCES = {
+    "BLOSUM62": (BLOSUM62, "X"),
+    "PAM250": (PAM250, "X"),
+    "EDNAFULL": (EDNAFULL, "N"),
+}
+
+_loaded = {}
+
+
+class SubstitutionMatrix:
+    """
+    A substitution matrix as a NumPy lookup table over uint8 symbol indices
+    """
+
+    def __init__(self, name, alphabet, scores, wildcard):
+        self.name = name
+        self.alphabet = alphabet
+        self.scores = scores
+
+        # Byte value -> symbol index, case-insensitive, unknown symbols -> wildcard
+        self.codes = np.full(256, alphabet.index(wildcard), dtype=np.uint8)
+        for index, symbol in enumerate(alphabet):
+            self.codes[ord(symbol.upper())] = index
+            self.codes[ord(symbol.lower())] = index
+
+    def __repr__(self):
+        return f"SubstitutionMatrix({self.name!r})"
+
+    @property
+    def max_score(self):
+        """The best score any pair of symbols can get"""
+        return int(self.scores.max())
+
+    def encode(self, seq):
+        """Encodes a sequence (str, bytes or byte codes) to uint8 symbol indices"""
+        return self.codes[np.asarray(sequence_codes(seq), dtype=np.uint8)]
+
+
+def parse_matrix(name, text, wildcard):
+    """
+    Parses a matrix in the NCBI/EMBOSS text layout into a SubstitutionMatrix
+    """
+    lines = [line.split() for line in text.strip().splitlines() if not line.startswith("#")]
+    alphabet = "".join(lines[0])
+
+    scores = np.array([[int(value) for value in line[1:]] for line in lines[1:]], dtype=np.int16)
+    if scores.shape != (len(alphabet), len(alphabet)):
+        raise ValueError(f"Malformed substitution matrix {name}")
+
+    return SubstitutionMatrix(name, alphabet, scores, wildcard)
+
+
+def get_matrix(name):
+    """
+    Returns the named substitution matrix, parsing it on first use only
+    """
+    key = name.upper()
+    if key not in _loaded:
+        if key not in MATRIX_SOURCES:
+            raise ValueError(f"Unknown substitution matrix {name}. "
+                             f"Available: {', '.join(MATRIX_SOURCES)}")
+        text, wildcard = MATRIX_SOURCES[key]
+        _loaded[key] = parse_matrix(key, text, wildcard)
+    return _loaded[key]
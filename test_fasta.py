@@ -0,0 +1,24 @@
+"""
+Tests of the FASTA index builder's line-layout checks
+"""
+
+import pytest
+
+from fasta import FaiEntry, build_fai
+
+
+def write(tmp_path, text):
+    path = tmp_path / "seqs.fa"
+    path.write_bytes(text)
+    return path
+
+
+def test_short_last_line(tmp_path):
+    path = write(tmp_path, b">x\nACGT\nAC\n>y\nGG\n")
+    assert build_fai(path) == [FaiEntry("x", 6, 3, 4, 5), FaiEntry("y", 2, 14, 2, 3)]
+
+
+@pytest.mark.parametrize("text", [b">x\nACGT\nAC\nACGT\n", b">x\nACGT\nACGTAC\n", b">x\nACGT\nACGTA"])
+def test_ragged_lines_rejected(tmp_path, text):
+    with pytest.raises(ValueError):
+        build_fai(write(tmp_path, text))
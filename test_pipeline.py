@@ -0,0 +1,48 @@
+"""
+Tests of the batch alignment pipeline's output conventions
+"""
+
+import pytest
+
+from alignment_cache import ResultCache
+from pipeline import align_pair
+
+
+# The query lacks the target's T at index 3 (a deletion from the reference),
+# and flanked by G and A that T can only be gapped in one place
+TARGET = "ACGTACGT"
+QUERY = "ACGACGT"
+
+
+@pytest.mark.parametrize("mode", ["nw", "sw"])
+def test_cigar_deletion_from_target(mode):
+    record = align_pair("query", QUERY, "target", TARGET, mode, 1, -1, -1)
+    assert record.cigar == "3M1D4M"
+    assert record.score == 6
+    assert record.start == (0, 0)
+    assert record.end == (len(QUERY), len(TARGET))
+
+
+@pytest.mark.parametrize("mode", ["nw", "sw"])
+def test_cigar_insertion_in_query(mode):
+    record = align_pair("query", TARGET, "target", QUERY, mode, 1, -1, -1)
+    assert record.cigar == "3M1I4M"
+    assert record.end == (len(TARGET), len(QUERY))
+
+
+@pytest.mark.parametrize("mode", ["nw", "sw"])
+def test_cigar_affine_gaps(mode):
+    record = align_pair("query", QUERY, "target", TARGET, mode, 2, -1, -3, gap_extend=-1)
+    assert record.cigar == "3M1D4M"
+    assert record.score == 2 * 7 - 3
+
+
+@pytest.mark.parametrize("gap_extend", [None, -1])
+def test_cached_records_match(tmp_path, gap_extend):
+    cache = ResultCache("record", str(tmp_path))
+    first = align_pair("query", QUERY, "target", TARGET, "sw", 2, -1, -3, gap_extend=gap_extend, cache=cache)
+    # A fresh cache on the same directory reads the record back from disk
+    cache = ResultCache("record", str(tmp_path))
+    again = align_pair("query", QUERY, "target", TARGET, "sw", 2, -1, -3, gap_extend=gap_extend, cache=cache)
+    assert again == first
+    assert (cache.hits, cache.misses) == (1, 0)